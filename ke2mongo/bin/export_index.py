@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Build the offset index sidecar files for KE EMu export files
+
+Index all files in the export directory:
+
+python bin/export_index.py
+
+Index specific files:
+
+python bin/export_index.py /path/to/ecatalogue.export.20160519.gz
+
+Re-import records from an export file, by IRN:
+
+python bin/export_index.py --reimport --module ecatalogue --date 20160519 1234 5678
+
+"""
+
+import os
+import sys
+import time
+import getopt
+from ke2mongo import config
+from ke2mongo.log import log
+from ke2mongo.lib.index import ExportFileIndex
+from ke2mongo.tasks.mongo import MongoTask
+
+# Import all the mongo tasks so they're findable in MongoTask.__subclasses__()
+from ke2mongo.tasks.mongo_catalogue import MongoCatalogueTask
+from ke2mongo.tasks.mongo_taxonomy import MongoTaxonomyTask
+from ke2mongo.tasks.mongo_multimedia import MongoMultimediaTask
+from ke2mongo.tasks.mongo_collection_index import MongoCollectionIndexTask
+from ke2mongo.tasks.mongo_collection_event import MongoCollectionEventTask
+from ke2mongo.tasks.mongo_site import MongoSiteTask
+
+
+def build(paths):
+
+    if not paths:
+        export_dir = config.get('keemu', 'export_dir')
+        paths = [os.path.join(export_dir, f) for f in os.listdir(export_dir) if 'export' in f and '.idx.' not in f]
+
+    for path in paths:
+        index = ExportFileIndex(path)
+        if index.is_current():
+            log.info('Index for %s is up to date', path)
+            continue
+        t = time.time()
+        index.build()
+        log.info('Indexed %s in %.2f sec', path, time.time() - t)
+
+
+def reimport(module, date, irns):
+
+    tasks = {cls.module: cls for cls in MongoTask.__subclasses__()}
+    task = tasks[module](date=date)
+    counts = task.import_irns(irns)
+    log.info('Re-imported %s %s records', sum(counts.values()), module)
+
+
+def main(argv):
+
+    opts, args = getopt.getopt(argv, "rm:d:", ["reimport", "module=", "date="])
+
+    module = None
+    date = None
+    reimport_irns = False
+
+    for opt, arg in opts:
+        if opt in ("-r", "--reimport"):
+            reimport_irns = True
+        elif opt in ("-m", "--module"):
+            module = arg
+        elif opt in ("-d", "--date"):
+            date = int(arg)
+
+    if reimport_irns:
+        reimport(module, date, [int(irn) for irn in args])
+    else:
+        build(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
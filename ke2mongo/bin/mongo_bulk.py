@@ -7,7 +7,13 @@ Copyright (c) 2013 'bens3'. All rights reserved.
 Running bulk does not delete anything from CKAN
 It's intended to be run to bulk load everything into a fresh CKAN instance
 
+The modules for each date can be imported concurrently, with multiple workers:
+
+python bin/mongo_bulk.py --workers 6
+
 """
+import sys
+import getopt
 from ke2mongo import config
 from ke2mongo.log import log
 from luigi import scheduler, worker
@@ -44,7 +50,15 @@ class BulkWorker(worker.Worker):
         raise BulkException
 
 
-def main():
+def main(argv):
+
+    opts, args = getopt.getopt(argv, "w:", ["workers="])
+
+    workers = 1
+
+    for opt, arg in opts:
+        if opt in ("-w", "--workers"):
+            workers = int(arg)
 
     update_markers = mongo_get_update_markers()
 
@@ -93,16 +107,21 @@ def main():
 
     sch = scheduler.CentralPlannerScheduler()
 
-    w = BulkWorker(scheduler=sch)
+    w = BulkWorker(scheduler=sch, worker_processes=workers)
 
     for export_date in export_dates:
 
         log.info('Processing date %s', export_date)
-        # We only need to call the mongo delete task, as all other tasks are a requirement
-        # NB: This doesn't delete anything from CKAN - if that's needed change this to DeleteTask
+        # Import the bulk task modules (concurrently if workers > 1) and then run the deletes
+        # Not MongoImportTask, as that includes MongoMultimediaTask
+        # NB: This doesn't delete anything from CKAN - so not UnpublishTask either; if that's needed change this to DeleteTask
+        for task in bulk_tasks:
+            if task not in (MongoDeleteTask, UnpublishTask):
+                w.add(task(date=export_date))
+        w.run()
         w.add(MongoDeleteTask(date=export_date, force=True))
         w.run()
         w.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Set the publishable image fields on multimedia records imported before they were added at import
+
+python bin/multimedia_publishable.py
+
+"""
+
+from ke2mongo.log import log
+from ke2mongo.lib.mongo import mongo_client_db
+from ke2mongo.lib.multimedia import get_publishable_fields, EMBARGO_FIELDS
+from ke2mongo.tasks.mongo_multimedia import MongoMultimediaTask
+
+# Number of records per bulk update
+BATCH_SIZE = 1000
+
+
+def main():
+
+    mongo_db = mongo_client_db()
+    collection = mongo_db[MongoMultimediaTask(date=None).collection_name]
+
+    fields = ['AdmPublishWebNoPasswordFlag', 'GenDigitalMediaId', 'MulMimeFormat', 'MulTitle'] + EMBARGO_FIELDS
+    cursor = collection.find({'isPublishableImage': {'$exists': False}}, fields)
+
+    bulk = collection.initialize_unordered_bulk_op()
+    count = 0
+
+    for record in cursor:
+        bulk.find({'_id': record['_id']}).update({'$set': get_publishable_fields(record)})
+        count += 1
+
+        if count % BATCH_SIZE == 0:
+            bulk.execute()
+            bulk = collection.initialize_unordered_bulk_op()
+            log.info('Updated %s multimedia records', count)
+
+    if count % BATCH_SIZE:
+        bulk.execute()
+
+    log.info('Updated %s multimedia records', count)
+
+    for index in MongoMultimediaTask.indexes:
+        collection.ensure_index(index)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Microbenchmark of catalogue record validation and processing
+
+Parses records from a catalogue export file, and times MongoCatalogueTask.prepare_record()
+against the checks it used before the validation rules (see lib.validation), reporting records/sec
+
+python bin/process_benchmark.py /path/to/ecatalogue.export.20160519.gz --records 100000
+
+"""
+
+import sys
+import time
+import getopt
+from uuid import UUID
+from datetime import datetime
+from itertools import islice
+from keparser import KEParser
+from ke2mongo.log import log
+from ke2mongo.lib.compression import open_export_file
+from ke2mongo.tasks import DATE_FORMAT
+from ke2mongo.lib.cites import get_cites_species
+from ke2mongo.tasks.mongo import InvalidRecordException
+from ke2mongo.tasks.mongo_catalogue import MongoCatalogueTask
+
+
+def legacy_validate(task, cites_species, data):
+    """
+    Validation and embargo date processing as it was before the validation rules
+    @param task: MongoCatalogueTask
+    @param cites_species: list of CITES species names
+    @param data: record
+    @return: None
+    """
+    if data.get('ColRecordType', 'Missing') in task.excluded_types:
+        raise InvalidRecordException
+
+    guid = data.get('AdmGUIDPreferredValue', None)
+
+    if guid:
+        try:
+            UUID(guid, version=4)
+        except ValueError:
+            raise InvalidRecordException
+
+    if not data.get('ColDepartment', None):
+        raise InvalidRecordException
+
+    date_inserted = data.get('AdmDateInserted', None)
+
+    if not date_inserted or len(DATE_FORMAT) != len(date_inserted):
+        raise InvalidRecordException
+
+    scientific_name = data.get('DarScientificName', None)
+
+    if scientific_name and scientific_name in cites_species:
+        data['cites'] = True
+
+    embargo_list = []
+
+    for f in ['NhmSecEmbargoDate', 'NhmSecEmbargoExtensionDate']:
+        if data.get(f):
+            embargo_list.append(time.mktime(datetime.strptime(data.get(f), "%Y-%m-%d").timetuple()))
+        else:
+            embargo_list.append(0)
+
+    data['RealEmbargoDate'] = max(embargo_list)
+    data['irn'] = str(data['irn'])
+    data['exportFileDate'] = task.date
+
+
+def benchmark(name, func, records):
+    """
+    Time func over copies of the records
+    @return: None
+    """
+    # Records are modified in place - so copy them before timing
+    records = [dict(record) for record in records]
+    valid = 0
+    t = time.time()
+
+    for record in records:
+        try:
+            func(record)
+        except InvalidRecordException:
+            continue
+        valid += 1
+
+    seconds = time.time() - t
+    log.info('%s: %s records (%s valid) in %.2f sec - %.0f records/sec', name, len(records), valid, seconds, len(records) / seconds if seconds else 0)
+
+
+def main(argv):
+
+    opts, args = getopt.getopt(argv, "n:", ["records="])
+
+    n = 100000
+
+    for opt, arg in opts:
+        if opt in ("-n", "--records"):
+            n = int(arg)
+
+    path = args[0]
+    task = MongoCatalogueTask(date=0)
+
+    f = open_export_file(path)
+
+    try:
+        records = list(islice(KEParser(f, file_path=path, schema_file=task.keemu_schema_file, flatten_mode=task.flatten_mode), n))
+    finally:
+        f.close()
+
+    # Apply the field converters first, as prepare_record does - they're not part of the comparison
+    records = [task.field_table.apply(record) for record in records]
+
+    cites_species = get_cites_species()
+
+    benchmark('Before', lambda record: legacy_validate(task, cites_species, record), records)
+
+    def _validate(record):
+        if task.validator.validate(record):
+            raise InvalidRecordException
+        task.process_record(record)
+
+    benchmark('After', _validate, records)
+
+    log.info('Rejected records: %s', ', '.join('%s=%s' % (k, v) for k, v in sorted(task.validator.counts.items())))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Benchmark of the export file readers
+
+Times reading every line of an uncompressed export file - as KEParser does - through
+ExportFileReader (buffered file reads) and MMapExportFile (memory mapped), and scanning
+its records with MMapExportFile.iter_records(), as the export file index does
+
+python bin/reader_benchmark.py /path/to/ecatalogue.export.20160519 --runs 3
+
+"""
+
+import os
+import sys
+import time
+import getopt
+from ke2mongo.log import log
+from ke2mongo.lib.file import ExportFileReader, MMapExportFile
+
+
+def read_lines(reader):
+    """
+    @return: number of lines read
+    """
+    lines = 0
+    for _ in iter(reader.readline, ''):
+        lines += 1
+    return lines
+
+
+def scan_records(reader):
+    """
+    @return: number of records found
+    """
+    records = 0
+    for record in reader.iter_records():
+        record.get('irn')
+        records += 1
+    return records
+
+
+def benchmark(name, open_reader, func, size, runs):
+    """
+    Time func over the reader - reporting the fastest run
+    @return: None
+    """
+    times = []
+
+    for _ in range(runs):
+        with open_reader() as reader:
+            t = time.time()
+            n = func(reader)
+            times.append(time.time() - t)
+
+    seconds = min(times)
+    log.info('%s: %s in %.2f sec - %.1f MB/s', name, n, seconds, size / 1048576.0 / seconds if seconds else 0)
+
+
+def main(argv):
+
+    opts, args = getopt.getopt(argv, "r:", ["runs="])
+
+    runs = 3
+
+    for opt, arg in opts:
+        if opt in ("-r", "--runs"):
+            runs = int(arg)
+
+    path = args[0]
+    size = os.path.getsize(path)
+
+    benchmark('ExportFileReader.readline', lambda: ExportFileReader(open(path, 'rb')), read_lines, size, runs)
+    benchmark('MMapExportFile.readline', lambda: MMapExportFile(path), read_lines, size, runs)
+    benchmark('MMapExportFile.iter_records', lambda: MMapExportFile(path), scan_records, size, runs)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
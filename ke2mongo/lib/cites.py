@@ -3,12 +3,30 @@
 """
 Created by 'bens3' on 2013-06-21.
 Copyright (c) 2013 'bens3'. All rights reserved.
+
+CITES species names, and matching scientific names against them
+
+The names are loaded from mongo the first time a name is matched, and cached as JSON in the cache
+directory (see lib.file.get_cache_dir()), keyed by the hash of the cites collection - so the cache is
+rebuilt whenever the collection changes.
+
 """
 
+import os
+import re
+import json
+from ConfigParser import NoOptionError, NoSectionError
+from pymongo.errors import OperationFailure
+from ke2mongo import config
+from ke2mongo.log import log
+from ke2mongo.lib.file import atomic_write, get_cache_dir
 from ke2mongo.lib.mongo import mongo_client_db
 
 CITES_COLLECTION = 'cites'
 
+re_whitespace = re.compile('\s+')
+
+
 def get_cites_species():
     """
     Load cites species names from mongo
@@ -24,4 +42,201 @@ def get_cites_species():
     """
     mongo_db = mongo_client_db()
     cursor = mongo_db[CITES_COLLECTION].find({'full_name': {'$ne': None}}, {'full_name':1})
-    return [r['full_name'].encode('utf8') for r in cursor]
\ No newline at end of file
+    return [r['full_name'].encode('utf8') for r in cursor]
+
+
+def get_cites_hash():
+    """
+    Get a checksum of the cites collection
+    @return: md5 hex digest, or None if dbhash isn't available
+    """
+    mongo_db = mongo_client_db()
+
+    try:
+        return mongo_db.command('dbhash', collections=[CITES_COLLECTION])['collections'][CITES_COLLECTION]
+    except (OperationFailure, KeyError):
+        # Hashing the names ourselves would mean loading them all - which is what the cache is there to avoid
+        return None
+
+
+def normalize_name(name):
+    """
+    Normalize a scientific name for matching - lower case, with whitespace collapsed
+    @param name: scientific name
+    @return: str
+    """
+    return re_whitespace.sub(' ', name).strip().lower()
+
+
+def strip_authors(name):
+    """
+    Remove the authorship from a scientific name - keeping the genus, and any lower
+    case epithets and rank markers up to the first author or year
+    Panthera leo persica (Meyer, 1826) => panthera leo persica
+    @param name: scientific name, in its original case
+    @return: normalized name
+    """
+    words = re_whitespace.split(name.strip())
+    kept = words[:1]
+
+    for word in words[1:]:
+        if not word or not word[0].islower():
+            break
+        kept.append(word)
+
+    return normalize_name(' '.join(kept))
+
+
+def get_genus(name):
+    """
+    Get the genus of a genus level CITES listing - eg. Panthera spp.
+    @param name: normalized name
+    @return: genus, or None if this isn't a genus level name
+    """
+    words = name.split(' ')
+
+    if len(words) == 1 or (len(words) == 2 and words[1] in ('spp.', 'spp')):
+        return words[0]
+
+    return None
+
+
+class CitesMatcher(object):
+    """
+    Match scientific names against the CITES species list
+
+    Names are compared exactly, as they always have been - and optionally:
+        normalize: normalized (see normalize_name()), so case and whitespace differences are ignored
+        strip_authors: without authorship, so Panthera leo Linnaeus, 1758 matches Panthera leo
+        genus: at genus level, so any species of a genus listed as eg. Panthera spp. matches
+    strip_authors and genus compare normalized names
+
+    The names are loaded the first time a name is matched, so creating a matcher doesn't
+    query mongo - use get_cites_matcher() for the matcher shared by the process
+
+    Usage:
+
+        matcher = get_cites_matcher()
+        if matcher.match(record['DarScientificName']):
+            ...
+
+    """
+
+    def __init__(self, normalize=False, strip_authors=False, genus=False):
+        self.normalize = normalize
+        self.strip_authors = strip_authors
+        self.genus = genus
+        self._names = None
+
+    @property
+    def names(self):
+        """
+        @return: dict with frozensets of names, normalized names, names without authors, and genera
+        """
+        if self._names is None:
+            self._names = self.load()
+        return self._names
+
+    @staticmethod
+    def build(species):
+        """
+        Build the name sets from the CITES species names
+        @param species: list of names
+        @return: dict of frozensets
+        """
+        names = set()
+        normalized = set()
+        stripped = set()
+        genera = set()
+
+        for name in species:
+            names.add(name)
+            normalized.add(normalize_name(name))
+            stripped.add(strip_authors(name))
+            genus = get_genus(normalize_name(name))
+            if genus:
+                genera.add(genus)
+
+        return {
+            'names': frozenset(names),
+            'normalized': frozenset(normalized),
+            'stripped': frozenset(stripped),
+            'genera': frozenset(genera)
+        }
+
+    def load(self):
+        """
+        Load the name sets from the cache - building and caching them if the cites collection has changed
+        If the collection can't be hashed, the names are built without the cache
+        @return: dict of frozensets
+        """
+        cites_hash = get_cites_hash()
+        cache_path = os.path.join(get_cache_dir(), 'cites.%s.json' % cites_hash) if cites_hash else None
+
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    return dict((k, frozenset(name.encode('utf8') for name in v)) for k, v in json.load(f).iteritems())
+            except (IOError, ValueError):
+                pass
+
+        log.info('Building CITES species names')
+        names = self.build(get_cites_species())
+
+        if cache_path:
+            with atomic_write(cache_path, 'w') as f:
+                json.dump(dict((k, sorted(v)) for k, v in names.iteritems()), f)
+
+        return names
+
+    def match(self, name):
+        """
+        Is a scientific name a CITES species
+        @param name: scientific name
+        @return: bool
+        """
+        if not name:
+            return False
+
+        names = self.names
+
+        if name in names['names']:
+            return True
+
+        normalized = normalize_name(name)
+
+        if self.normalize and normalized in names['normalized']:
+            return True
+
+        if self.strip_authors and strip_authors(name) in names['stripped']:
+            return True
+
+        if self.genus and normalized.split(' ', 1)[0] in names['genera']:
+            return True
+
+        return False
+
+    __contains__ = match
+
+
+_cites_matcher = None
+
+
+def get_cites_matcher():
+    """
+    Get the CITES matcher shared by the process
+    Normalized, author stripped and genus level matching are set with normalize, strip_authors and genus in the cites config section
+    @return: CitesMatcher
+    """
+    global _cites_matcher
+
+    if _cites_matcher is None:
+        options = {}
+        for option in ['normalize', 'strip_authors', 'genus']:
+            try:
+                options[option] = config.getboolean('cites', option)
+            except (NoSectionError, NoOptionError):
+                pass
+        _cites_matcher = CitesMatcher(**options)
+
+    return _cites_matcher
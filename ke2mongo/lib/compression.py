@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Decompression of KE EMu export files
+
+Export files can be uncompressed, gzipped (.gz), or if the optional libraries are
+installed, zstandard (.zst) or xz (.xz) compressed. Each compression type has a luigi
+format, which decompresses in process through large buffers rather than piping
+through an external process.
+
+Gzipped files written in BGZF blocks (eg. with bgzip) are decompressed in parallel
+by a pool of threads - the size of each block is stored in its header, so the file
+can be split into blocks without decompressing it.
+
+Decompression throughput is logged when each file is closed.
+
+"""
+
+import time
+import zlib
+import struct
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from ConfigParser import NoOptionError
+import luigi.format
+from ke2mongo import config
+from ke2mongo.log import log
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# zlib window bits for decoding gzip headers
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Size of a BGZF block header, with the BC extra subfield holding the block size
+BGZF_HEADER_SIZE = 18
+
+
+def get_decompress_threads():
+    """
+    Number of threads to use decompressing BGZF files
+    Set with decompress_threads in the keemu config section - defaults to the number of CPUs
+    @return: int
+    """
+    try:
+        return config.getint('keemu', 'decompress_threads')
+    except NoOptionError:
+        return multiprocessing.cpu_count()
+
+
+def get_bgzf_block_size(header):
+    """
+    Get the total size of a BGZF block from its header
+    @param header: data starting with the block header
+    @return: block size in bytes, or None if this isn't a BGZF block
+    """
+    # Gzip magic, deflate, with the FEXTRA flag set
+    if len(header) < 12 or header[:4] != '\x1f\x8b\x08\x04':
+        return None
+
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = header[12:12 + xlen]
+    i = 0
+
+    # Loop through the extra subfields, looking for BC
+    while i + 4 <= len(extra):
+        slen = struct.unpack('<H', extra[i + 2:i + 4])[0]
+        if extra[i:i + 2] == 'BC' and slen == 2 and i + 6 <= len(extra):
+            # BSIZE is the block size - 1
+            return struct.unpack('<H', extra[i + 4:i + 6])[0] + 1
+        i += 4 + slen
+
+    return None
+
+
+def decompress_gzip_members(data):
+    """
+    Decompress data made up of one or more complete gzip members
+    @param data: compressed data
+    @return: decompressed data
+    """
+    out = []
+
+    while data:
+        d = zlib.decompressobj(GZIP_WBITS)
+        out.append(d.decompress(data))
+        data = d.unused_data
+
+    return ''.join(out)
+
+
+class DecompressReader(object):
+    """
+    Read only file object, decompressing a compressed file object through a large buffer
+    Subclasses implement _decompress(), returning the next chunk of decompressed data
+    """
+
+    # Size of reads from the compressed file
+    chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, f, head=''):
+        """
+        @param f: compressed file object
+        @param head: any data already read from the start of f
+        """
+        self._f = f
+        self._head = head
+        self.name = getattr(f, 'name', None)
+        self._buffer = ''
+        self._offset = 0
+        self._pos = 0
+        self._eof = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._time = time.time()
+        self._closed = False
+
+    def _read_compressed(self, size=None):
+        if self._head:
+            data, self._head = self._head, ''
+        else:
+            data = self._f.read(size or self.chunk_size)
+        self.bytes_in += len(data)
+        return data
+
+    def _decompress(self):
+        """
+        @return: next chunk of decompressed data, or an empty string at the end of the file
+        """
+        raise NotImplementedError
+
+    def _fill(self):
+        """
+        Add the next chunk of decompressed data to the buffer
+        @return: False if at the end of the file
+        """
+        if self._eof:
+            return False
+
+        data = self._decompress()
+
+        if not data:
+            self._eof = True
+            return False
+
+        self.bytes_out += len(data)
+        self._buffer = self._buffer[self._offset:] + data
+        self._offset = 0
+        return True
+
+    def _consume(self, end):
+        data = self._buffer[self._offset:end]
+        self._offset = end
+        self._pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        while True:
+            i = self._buffer.find('\n', self._offset)
+            if i != -1:
+                end = i + 1
+                break
+            if 0 <= size <= len(self._buffer) - self._offset or not self._fill():
+                end = len(self._buffer)
+                break
+
+        if size >= 0:
+            end = min(end, self._offset + size)
+
+        return self._consume(end)
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) - self._offset < size) and self._fill():
+            pass
+
+        return self._consume(len(self._buffer) if size < 0 else min(self._offset + size, len(self._buffer)))
+
+    def seek(self, offset):
+        """
+        Move forward to offset, by reading up to it
+        """
+        if offset < self._pos:
+            raise IOError('Cannot seek backwards in a compressed file')
+
+        while self._pos < offset and self.read(min(self.chunk_size, offset - self._pos)):
+            pass
+
+    def tell(self):
+        return self._pos
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        self._f.close()
+
+        seconds = time.time() - self._time
+        mb = self.bytes_out / 1048576.0
+
+        log.info('Decompressed %s: %.1f MB from %.1f MB in %.2f sec (%.1f MB/s)', self.name, mb, self.bytes_in / 1048576.0, seconds, mb / seconds if seconds else 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ZlibReader(DecompressReader):
+    """
+    Decompress gzipped files in process with zlib
+    Files with multiple gzip members are decompressed member by member
+    """
+
+    def __init__(self, f, head=''):
+        super(ZlibReader, self).__init__(f, head)
+        self._d = zlib.decompressobj(GZIP_WBITS)
+
+    def _decompress(self):
+        while True:
+            data = self._read_compressed()
+
+            if not data:
+                return self._d.flush()
+
+            out = self._d.decompress(data)
+
+            # Reached the end of a gzip member - start a new decompressor for the next one
+            while self._d.unused_data:
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(GZIP_WBITS)
+                out += self._d.decompress(data)
+
+            if out:
+                return out
+
+
+class BGZFReader(DecompressReader):
+    """
+    Decompress BGZF gzipped files, with blocks decompressed in parallel by a pool of threads
+    zlib releases the GIL while decompressing, so threads run concurrently
+    """
+
+    # Compressed size of the groups of blocks passed to each thread
+    chunk_size = 1024 * 1024
+
+    def __init__(self, f, head='', threads=2):
+        super(BGZFReader, self).__init__(f, head)
+        self.threads = threads
+        self._pool = ThreadPool(threads)
+        self._chunks = self._iter_chunks()
+        self._results = deque()
+
+    def _iter_chunks(self):
+        """
+        Split the compressed data into chunks of complete BGZF blocks
+        @return: generator of compressed data
+        """
+        buf = ''
+
+        while True:
+            data = self._read_compressed()
+            buf += data
+            end = 0
+
+            while True:
+                size = get_bgzf_block_size(buf[end:end + BGZF_HEADER_SIZE])
+                if size is None or end + size > len(buf):
+                    break
+                end += size
+
+            if size is None and len(buf) - end >= BGZF_HEADER_SIZE:
+                raise IOError('Invalid BGZF block in %s' % self.name)
+
+            if end:
+                yield buf[:end]
+                buf = buf[end:]
+
+            if not data:
+                if buf:
+                    raise IOError('Truncated BGZF block in %s' % self.name)
+                return
+
+    def _decompress(self):
+        while True:
+            # Keep enough chunks queued that all the threads are busy
+            while len(self._results) < self.threads * 2:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._results.append(self._pool.apply_async(decompress_gzip_members, (chunk,)))
+
+            if not self._results:
+                return ''
+
+            out = self._results.popleft().get()
+
+            # The BGZF end of file marker is an empty block
+            if out:
+                return out
+
+    def close(self):
+        self._pool.terminate()
+        super(BGZFReader, self).close()
+
+
+class ZstdReader(DecompressReader):
+    """
+    Decompress zstandard files
+    """
+
+    def __init__(self, f, head=''):
+        super(ZstdReader, self).__init__(f, head)
+        self._d = zstandard.ZstdDecompressor().decompressobj()
+
+    def _decompress(self):
+        while True:
+            data = self._read_compressed()
+
+            if not data:
+                return ''
+
+            out = self._d.decompress(data)
+
+            if out:
+                return out
+
+
+class XzReader(DecompressReader):
+    """
+    Decompress xz files
+    Files with multiple concatenated streams are decompressed stream by stream
+    """
+
+    def __init__(self, f, head=''):
+        super(XzReader, self).__init__(f, head)
+        self._d = lzma.LZMADecompressor()
+
+    def _decompress(self):
+        while True:
+            data = self._read_compressed()
+
+            if not data:
+                return ''
+
+            out = self._d.decompress(data)
+
+            while self._d.eof and self._d.unused_data:
+                data = self._d.unused_data
+                self._d = lzma.LZMADecompressor()
+                out += self._d.decompress(data)
+
+            if out:
+                return out
+
+
+class GzipFormat(luigi.format.Format):
+    """
+    Read gzipped files - BGZF files are decompressed in parallel if threads > 1
+    """
+
+    def __init__(self, threads=1):
+        self.threads = threads
+
+    def pipe_reader(self, input_pipe):
+        head = input_pipe.read(BGZF_HEADER_SIZE)
+
+        if self.threads > 1 and get_bgzf_block_size(head):
+            return BGZFReader(input_pipe, head, threads=self.threads)
+
+        return ZlibReader(input_pipe, head)
+
+
+class ZstdFormat(luigi.format.Format):
+
+    def pipe_reader(self, input_pipe):
+        return ZstdReader(input_pipe)
+
+
+class XzFormat(luigi.format.Format):
+
+    def pipe_reader(self, input_pipe):
+        return XzReader(input_pipe)
+
+
+def get_export_formats():
+    """
+    List of supported export file extensions and their formats, in order of preference
+    .zst and .xz are only supported if zstandard / lzma are installed
+    @return: list of (extension, format)
+    """
+    formats = [
+        ('', None),
+        ('.gz', GzipFormat(get_decompress_threads()))
+    ]
+
+    if zstandard:
+        formats.append(('.zst', ZstdFormat()))
+
+    if lzma:
+        formats.append(('.xz', XzFormat()))
+
+    return formats
+
+
+def get_export_file_format(path):
+    """
+    Get the format of an export file from its extension
+    @param path: export file path
+    @return: luigi format, or None if the file is not compressed
+    """
+    for extension, format in get_export_formats():
+        if extension and path.endswith(extension):
+            return format
+
+    return None
+
+
+def open_export_file(path):
+    """
+    Open an export file, decompressing it if it's compressed
+    @param path: export file path
+    @return: file object
+    """
+    format = get_export_file_format(path)
+    f = open(path, 'rb')
+
+    if format:
+        return format.pipe_reader(f)
+
+    return f
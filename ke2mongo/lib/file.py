@@ -7,8 +7,64 @@ Copyright (c) 2013 'bens3'. All rights reserved.
 
 import sys
 import os
+import mmap
+import shutil
+import tempfile
+import numpy as np
+from contextlib import contextmanager
 from ConfigParser import NoOptionError
 from ke2mongo import config
+from ke2mongo.lib.compression import get_export_formats, open_export_file
+
+def get_full_export_date():
+    """
+    Gets the date of the last full export
+    @return: date, or None if not set
+    """
+    try:
+        return int(config.get('keemu', 'full_export_date'))
+    except NoOptionError:
+        return None
+
+
+def get_chunk_dir():
+    """
+    Gets the directory export files are split into chunks in - see KESplitTask
+    Set with chunk_dir in the keemu config section - defaults to a chunks directory in the export dir
+    @return: path
+    """
+    try:
+        return config.get('keemu', 'chunk_dir')
+    except NoOptionError:
+        return os.path.join(config.get('keemu', 'export_dir'), 'chunks')
+
+
+def get_cache_dir():
+    """
+    Gets the directory the parsed schema and CITES names are cached in - see lib.schema and lib.cites
+    Set with cache_dir in the keemu config section - defaults to a .cache directory in the export dir
+    The directory is created readable only by the current user - and caches are never read from
+    a directory anyone else can write to
+    @return: path
+    """
+    try:
+        cache_dir = config.get('keemu', 'cache_dir')
+    except NoOptionError:
+        cache_dir = os.path.join(config.get('keemu', 'export_dir'), '.cache')
+
+    try:
+        os.makedirs(cache_dir, 0700)
+    except OSError:
+        if not os.path.isdir(cache_dir):
+            raise
+
+    stat = os.stat(cache_dir)
+
+    if stat.st_uid != os.getuid() or stat.st_mode & 0022:
+        raise IOError('Cache directory %s must be owned by the current user, and not group or world writable' % cache_dir)
+
+    return cache_dir
+
 
 def get_export_file_dates():
     """
@@ -18,10 +74,7 @@ def get_export_file_dates():
 
     export_dir = config.get('keemu', 'export_dir')
 
-    try:
-        full_export_date = int(config.get('keemu', 'full_export_date'))
-    except NoOptionError:
-        full_export_date = None
+    full_export_date = get_full_export_date()
 
     files = [f for f in os.listdir(export_dir) if os.path.isfile(os.path.join(export_dir,f))]
 
@@ -30,8 +83,10 @@ def get_export_file_dates():
 
     for f in files:
 
-        # So this will work with both .gz and not compressed files
-        f = f.replace('.gz', '')
+        # So this will work with both compressed and not compressed files
+        for extension, _ in get_export_formats():
+            if extension and f.endswith(extension):
+                f = f[:-len(extension)]
 
         try:
             # Extract the date from the file name
@@ -58,4 +113,329 @@ def get_export_file_dates():
     # Make sure they are in the right order and convert to list
     dates = sorted(list(dates))
 
-    return dates
\ No newline at end of file
+    return dates
+
+# Line terminating each record in a KE EMu export file
+RECORD_DELIMITER = '###'
+
+
+def get_export_file_ranges(path, n):
+    """
+    Split an (uncompressed) export file into n byte ranges, each ending on a record boundary
+    Ranges will be uneven if records are large - and there may be fewer than n for small files
+    @param path: export file path
+    @param n: number of ranges
+    @return: list of (start, end) offsets
+    """
+
+    size = os.path.getsize(path)
+    offsets = [0]
+
+    with open(path, 'rb') as f:
+        for i in range(1, n):
+
+            # Move to the approximate split point - but never before the previous boundary
+            f.seek(max(size * i // n, offsets[-1]))
+
+            # We're probably part way through a line, so skip to the end of it
+            # And then keep reading until we hit the end of the record
+            if f.tell():
+                f.readline()
+
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if line.rstrip('\r\n') == RECORD_DELIMITER:
+                    break
+
+            offsets.append(f.tell())
+
+    offsets.append(size)
+
+    # Remove any empty ranges (multiple split points within the same record)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+
+
+def get_shard_duplicates(shard_irns):
+    """
+    Find the IRNs written by more than one shard - and the last shard each was written by
+    @param shard_irns: list of IRN arrays written by each shard - in file order
+    @return: dict of shard index => set of IRNs last written by that shard, for IRNs
+             appearing in an earlier shard too
+    """
+    irns = np.concatenate(shard_irns) if shard_irns else np.array([], dtype=np.int64)
+
+    if not len(irns):
+        return {}
+
+    shards = np.repeat(np.arange(len(shard_irns)), [len(a) for a in shard_irns])
+
+    # Sort by IRN, then shard - and compare the first and last shard for each IRN
+    order = np.lexsort((shards, irns))
+    irns = irns[order]
+    shards = shards[order]
+    is_new_irn = irns[1:] != irns[:-1]
+    first_shards = shards[np.insert(is_new_irn, 0, True)]
+    is_last = np.append(is_new_irn, True)
+    last_shards = shards[is_last]
+    duplicates = first_shards != last_shards
+    duplicate_irns = irns[is_last][duplicates]
+    duplicate_shards = last_shards[duplicates]
+
+    return dict((int(shard), set(duplicate_irns[duplicate_shards == shard].tolist())) for shard in np.unique(duplicate_shards))
+
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """
+    Write to a temporary file, which is renamed to path once it has been written and closed
+    So a partially written file is never used - the temporary file is in the same directory, so the rename is atomic
+    If writing fails, the temporary file is removed and path is left as it was
+
+    Usage:
+
+        with atomic_write(path) as f:
+            f.write(data)
+
+    @param path: file path
+    @param mode: file mode
+    @return: file object
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.%s.' % os.path.basename(path))
+
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def decompress_export_file(path):
+    """
+    Decompress a compressed export file to a temporary file, so it can be split into ranges
+    The caller is responsible for removing the temporary file
+    @param path: compressed export file path
+    @return: temporary file path
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix='%s.' % os.path.basename(path))
+
+    with os.fdopen(fd, 'wb') as f_out:
+        f_in = open_export_file(path)
+        try:
+            shutil.copyfileobj(f_in, f_out, 16 * 1024 * 1024)
+        finally:
+            f_in.close()
+
+    return tmp_path
+
+
+class ExportFileReader(object):
+    """
+    Read only wrapper around an export file object, keeping track of the byte offset
+    in the (uncompressed) export file - so we know where each record parsed by KEParser ends
+
+    Optionally limited to end at a byte offset
+    """
+
+    # Size of reads when skipping forward in files that cannot seek
+    skip_chunk_size = 16 * 1024 * 1024
+
+    def __init__(self, f, start=0, end=None):
+        self._f = f
+        self._pos = 0
+        self.start = start
+        self.end = end
+        self.seek(start)
+
+    def seek(self, offset):
+        """
+        Move forward to offset
+        Compressed streams and pipes cannot seek, so read up to the offset instead
+        """
+        if offset <= self._pos:
+            return
+
+        try:
+            self._f.seek(offset)
+        except (AttributeError, IOError):
+            while self._pos < offset:
+                data = self._f.read(min(self.skip_chunk_size, offset - self._pos))
+                if not data:
+                    break
+                self._pos += len(data)
+        else:
+            self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def readline(self):
+        if self.end is None:
+            line = self._f.readline()
+        elif self._pos >= self.end:
+            return ''
+        else:
+            line = self._f.readline(self.end - self._pos)
+        self._pos += len(line)
+        return line
+
+    def read(self, size=-1):
+        if self.end is not None:
+            remaining = self.end - self._pos
+            if size < 0 or size > remaining:
+                size = remaining
+        data = self._f.read(size)
+        self._pos += len(data)
+        return data
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ExportRecord(object):
+    """
+    A record in a memory mapped export file
+    Nothing is copied out of the file until a field value or the raw record is requested
+    """
+
+    def __init__(self, mm, start, end):
+        self._mm = mm
+        self.start = start
+        self.end = end
+
+    def get(self, field, default=None):
+        """
+        Get the first value of a field, without parsing the rest of the record
+        @param field: field name
+        @param default: value to return if the field isn't in the record
+        @return: str
+        """
+        prefix = '%s:1=' % field
+        i = self._mm.find(prefix, self.start, self.end)
+
+        # Make sure we've matched the start of a line, not the end of another field name
+        while i > self.start and self._mm[i - 1] != '\n':
+            i = self._mm.find(prefix, i + 1, self.end)
+
+        if i == -1:
+            return default
+
+        i += len(prefix)
+        j = self._mm.find('\n', i, self.end)
+
+        return self._mm[i:j if j != -1 else self.end].rstrip('\r')
+
+    def raw(self):
+        return self._mm[self.start:self.end]
+
+
+class MMapExportFile(object):
+    """
+    Memory mapped, read only file object for uncompressed export files
+
+    Records can be iterated over as byte ranges with iter_records() without copying
+    any lines - so it's used for scanning export files for the index (see lib.index).
+    It has the same interface as ExportFileReader, but isn't used for parsing: readline()
+    copies each line out of the map, and is around half the speed of buffered reads
+    (see bin/reader_benchmark.py).
+
+    Can be limited to part of an export file - start and end should be record
+    boundaries, as returned by get_export_file_ranges()
+    """
+
+    def __init__(self, path, start=0, end=None):
+        self.path = path
+        self._f = open(path, 'rb')
+        size = os.path.getsize(path)
+
+        # Empty files cannot be mapped
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else ''
+
+        self.start = start
+        self.end = size if end is None else min(end, size)
+        self._pos = start
+
+    def seek(self, offset):
+        if offset > self._pos:
+            self._pos = min(offset, self.end)
+
+    def tell(self):
+        return self._pos
+
+    def readline(self):
+        if self._pos >= self.end:
+            return ''
+        i = self._mm.find('\n', self._pos, self.end)
+        i = self.end if i == -1 else i + 1
+        line = self._mm[self._pos:i]
+        self._pos = i
+        return line
+
+    def read(self, size=-1):
+        end = self.end if size < 0 else min(self._pos + size, self.end)
+        data = self._mm[self._pos:end]
+        self._pos = end
+        return data
+
+    def iter_records(self):
+        """
+        Iterate through the records from the current position
+        @return: generator of ExportRecord
+        """
+        delimiter = '\n%s' % RECORD_DELIMITER
+        delimiter_end = len(delimiter)
+
+        while self._pos < self.end:
+            start = self._pos
+            # Search from the previous character, so we can match a delimiter on the first line
+            i = self._mm.find(delimiter, max(start - 1, 0), self.end)
+
+            while i != -1 and self._mm[i + delimiter_end:i + delimiter_end + 1] not in ('\n', '\r', ''):
+                # Line starts with, but isn't the delimiter
+                i = self._mm.find(delimiter, i + 1, self.end)
+
+            if i == -1:
+                self._pos = self.end
+            else:
+                j = self._mm.find('\n', i + 1, self.end)
+                self._pos = self.end if j == -1 else j + 1
+
+            yield ExportRecord(self._mm, start, self._pos)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        if self._mm:
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
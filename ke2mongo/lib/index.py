@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Sidecar index of the records in a KE EMu export file
+
+For each record, the index stores the irn, and the byte offset and length of the record
+in the (uncompressed) export file, as a numpy array sorted by irn. The index is saved
+alongside the export file, so it only needs to be built once, and is memory mapped on load.
+
+"""
+
+import os
+import json
+import numpy as np
+from array import array
+from ke2mongo.log import log
+from ke2mongo.lib.file import RECORD_DELIMITER, MMapExportFile, atomic_write
+from ke2mongo.lib.compression import get_export_file_format, open_export_file
+
+INDEX_DTYPE = np.dtype([('irn', '<i8'), ('offset', '<i8'), ('length', '<i8')])
+
+
+class ExportFileIndex(object):
+    """
+    Index of irn => byte offset and length for an export file
+
+    Usage:
+
+        index = ExportFileIndex.get(path)
+        offset, length = index.lookup(irn)
+        records = index.read_records([irn, irn])
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = '%s.idx.npy' % path
+        self.meta_path = '%s.idx.json' % path
+        self._index = None
+
+    @classmethod
+    def get(cls, path):
+        """
+        Get the index for an export file - building it if it doesn't exist or is out of date
+        @param path: export file path
+        @return: ExportFileIndex
+        """
+        index = cls(path)
+
+        if not index.is_current():
+            index.build()
+
+        return index
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = np.load(self.index_path, mmap_mode='r')
+        return self._index
+
+    @property
+    def sidecar_paths(self):
+        return [self.index_path, self.meta_path]
+
+    def _stat(self):
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def is_current(self):
+        """
+        Does the index exist, and was it built from the current version of the file
+        @return: bool
+        """
+        if not os.path.exists(self.index_path):
+            return False
+
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return False
+
+        return meta.get('file') == self._stat()
+
+    def build(self):
+        """
+        Scan the export file, and save the offset and length of each record
+        @return: None
+        """
+        log.info('Building index for %s', self.path)
+
+        irns = array('l')
+        offsets = array('l')
+        lengths = array('l')
+
+        stat = self._stat()
+
+        if get_export_file_format(self.path):
+            offset = 0
+            start = 0
+            irn = None
+
+            f = open_export_file(self.path)
+
+            try:
+                for line in f:
+                    offset += len(line)
+                    if irn is None and line.startswith('irn:1='):
+                        irn = int(line[6:])
+                    elif line.rstrip('\r\n') == RECORD_DELIMITER:
+                        # Skip any records without an IRN
+                        if irn is not None:
+                            irns.append(irn)
+                            offsets.append(start)
+                            lengths.append(offset - start)
+                        start = offset
+                        irn = None
+            finally:
+                f.close()
+
+        else:
+            # Uncompressed files can be scanned record by record, just reading the IRN
+            with MMapExportFile(self.path) as f:
+                for record in f.iter_records():
+                    irn = record.get('irn')
+                    # Skip any records without an IRN
+                    if irn is not None:
+                        irns.append(int(irn))
+                        offsets.append(record.start)
+                        lengths.append(record.end - record.start)
+                offset = f.tell()
+
+        index = np.empty(len(irns), dtype=INDEX_DTYPE)
+        index['irn'] = irns
+        index['offset'] = offsets
+        index['length'] = lengths
+
+        # Stable sort, so duplicate IRNs stay in file order
+        index = index[np.argsort(index['irn'], kind='mergesort')]
+
+        with atomic_write(self.index_path) as f:
+            np.save(f, index)
+
+        with atomic_write(self.meta_path, 'w') as f:
+            json.dump({'file': stat, 'records': len(index), 'size': offset}, f)
+
+        self._index = None
+
+        log.info('Indexed %s records in %s', len(index), self.path)
+
+    def lookup(self, irn):
+        """
+        Get the offset and length of a record
+        If the IRN is duplicated in the export, the last record is used
+        @param irn: irn
+        @return: tuple of offset, length
+        """
+        irns = self.index['irn']
+        i = np.searchsorted(irns, irn, side='right') - 1
+
+        if i < 0 or irns[i] != irn:
+            raise KeyError(irn)
+
+        return int(self.index['offset'][i]), int(self.index['length'][i])
+
+    def read_records(self, irns):
+        """
+        Read the raw records for a list of IRNs, in file order
+        IRNs not in the export file are ignored
+        @param irns: list of irns
+        @return: list of record strings
+        """
+        locations = []
+
+        for irn in irns:
+            try:
+                locations.append(self.lookup(irn))
+            except KeyError:
+                log.debug('IRN %s not in %s', irn, self.path)
+
+        records = []
+
+        # Read in file order so compressed files only need to be read forward
+        f = open_export_file(self.path)
+
+        try:
+            for offset, length in sorted(set(locations)):
+                f.seek(offset)
+                records.append(f.read(length))
+        finally:
+            f.close()
+
+        return records
+
+    def get_ranges(self, n, size):
+        """
+        Split the export file into n byte ranges, ending on record boundaries
+        Like lib.file.get_export_file_ranges(), without having to scan the file - each split point
+        is the start of the first record at or after the even split, so may be a record earlier
+        @param n: number of ranges
+        @param size: uncompressed file size
+        @return: list of (start, end) offsets
+        """
+        starts = np.sort(self.index['offset'])
+        offsets = [0]
+
+        for i in range(1, n):
+            j = np.searchsorted(starts, size * i // n)
+            offsets.append(max(int(starts[j]) if j < len(starts) else size, offsets[-1]))
+
+        offsets.append(size)
+
+        return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
@@ -9,8 +9,12 @@ import re
 import luigi
 from collections import OrderedDict
 from pymongo import MongoClient
+from ConfigParser import NoOptionError, NoSectionError
 from ke2mongo import config
 
+# Default maximum size of a batch of records written to mongo
+DEFAULT_BATCH_MB = 16
+
 
 def mongo_client_db(database=config.get('mongo', 'database'), host=config.get('mongo', 'host')):
     return MongoClient(host)[database]
@@ -20,6 +24,89 @@ def mongo_get_marker_collection_name():
     return luigi.configuration.get_config().get('postgres', 'marker-table', 'table_updates')
 
 
+def mongo_get_writer_resource():
+    """
+    Name of the luigi resource limiting the number of tasks writing to the mongo host at once
+    Set the limit in the resources section of the luigi config, eg. mongo_writers_127_0_0_1 = 3
+    @return: resource name
+    """
+    return 'mongo_writers_%s' % re.sub('\W+', '_', config.get('mongo', 'host'))
+
+
+def mongo_get_writer_resources():
+    """
+    Luigi resources used by a task writing to mongo
+    luigi caps any resource missing from its resources config at 1 - so the writer resource is only
+    used if a limit has been set, otherwise tasks would write one at a time whatever the number of workers
+    @return: dict of resource name => amount
+    """
+    resource = mongo_get_writer_resource()
+
+    if resource in luigi.configuration.get_config().getintdict('resources'):
+        return {resource: 1}
+
+    return {}
+
+
+def mongo_get_batch_bytes():
+    """
+    Maximum estimated BSON size in bytes of a batch written to mongo
+    Set with batch_mb in the mongo config section
+    @return: int
+    """
+    try:
+        batch_mb = config.getfloat('mongo', 'batch_mb')
+    except NoOptionError:
+        batch_mb = DEFAULT_BATCH_MB
+
+    return int(batch_mb * 1024 * 1024)
+
+
+def mongo_get_write_profile(name):
+    """
+    Get a write profile from the config - set in a write_profile:[name] section, with
+    w and j for the write concern, and ordered for whether bulk updates are ordered
+    @param name: profile name
+    @return: dict of write_concern and ordered
+    """
+    section = 'write_profile:%s' % name
+
+    if not config.has_section(section):
+        raise NoSectionError(section)
+
+    write_concern = {}
+
+    try:
+        w = config.get(section, 'w')
+        write_concern['w'] = int(w) if w.isdigit() else w
+    except NoOptionError:
+        pass
+
+    try:
+        write_concern['j'] = config.getboolean(section, 'j')
+    except NoOptionError:
+        pass
+
+    try:
+        ordered = config.getboolean(section, 'ordered')
+    except NoOptionError:
+        ordered = False
+
+    return {'write_concern': write_concern, 'ordered': ordered}
+
+
+def mongo_get_denormalise():
+    """
+    Whether esites / ecollectionevents fields are embedded in the catalogue records - see MongoDenormaliseTask
+    Set with denormalise in the mongo config section
+    @return: bool
+    """
+    try:
+        return config.getboolean('mongo', 'denormalise')
+    except NoOptionError:
+        return False
+
+
 def mongo_get_update_markers():
 
     mongo_db = mongo_client_db()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Publishable image fields for multimedia records, set on import by MongoMultimediaTask
+and read by DatasetTask.ensure_multimedia()
+
+"""
+
+# Media store URL for image previews
+MEDIA_URL = 'http://www.nhm.ac.uk/services/media-store/asset/{mam_id}/contents/preview'
+
+# Embargo date fields - images are publishable from the latest of these
+EMBARGO_FIELDS = ['NhmSecEmbargoDate', 'NhmSecEmbargoExtensionDate']
+
+
+def get_publishable_fields(record):
+    """
+    Get the publishable image fields for a multimedia record - see DatasetTask.ensure_multimedia()
+    The embargo date is stored rather than whether the embargo has lapsed, so records become
+    publishable when their embargo lapses, without being reprocessed
+    @param record: multimedia record
+    @return: dict of isPublishableImage, publishableFrom (YYYY-MM-DD, or empty if not embargoed) and media
+    """
+    media_id = record.get('GenDigitalMediaId')
+    is_publishable = record.get('AdmPublishWebNoPasswordFlag') == 'Y' and bool(media_id) and media_id != 'Pending'
+
+    embargo_dates = [str(record[f]) for f in EMBARGO_FIELDS if record.get(f)]
+
+    fields = {
+        'isPublishableImage': is_publishable,
+        'publishableFrom': max(embargo_dates) if embargo_dates else ''
+    }
+
+    if is_publishable:
+        # The media entry used in the dataset associatedMedia field
+        media = {
+            'identifier': MEDIA_URL.format(mam_id=media_id),
+            'format': 'image/%s' % record.get('MulMimeFormat'),
+            'type': 'StillImage',
+            'license': 'http://creativecommons.org/licenses/by/4.0/',
+            'rightsHolder': 'The Trustees of the Natural History Museum, London'
+        }
+
+        # Add the title if it exists
+        if record.get('MulTitle', None):
+            media['title'] = record.get('MulTitle')
+
+        fields['media'] = media
+
+    return fields
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+KE EMu schema, and per field converters and defaults compiled against it
+
+The schema file is parsed once, and the field types of each module are cached as JSON in the
+cache directory (see lib.file.get_cache_dir()), keyed by the hash of the schema file - so the
+cache is rebuilt whenever the schema changes.
+
+"""
+
+import os
+import re
+import json
+import hashlib
+from ke2mongo.log import log
+from ke2mongo.lib.file import atomic_write, get_cache_dir
+
+# Converters which can be used by name in MongoTask.field_converters
+CONVERTERS = {
+    'string': str,
+    'int': int,
+    'float': float,
+    'bool': bool,
+}
+
+re_schema_line = re.compile("^\s*(table|ColumnName|DataType)\s*=>\s*'([^']*)'")
+
+
+def get_schema_hash(schema_file):
+    """
+    @param schema_file: path to the KE EMu schema
+    @return: md5 hex digest of the schema file
+    """
+    h = hashlib.md5()
+
+    with open(schema_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def parse_schema(schema_file):
+    """
+    Parse the field names and data types for each module from the KE EMu (perl) schema file
+    @param schema_file: path to the KE EMu schema
+    @return: dict of module => dict of field name => data type
+    """
+    schema = {}
+    fields = None
+    column = None
+
+    with open(schema_file) as f:
+        for line in f:
+            result = re_schema_line.match(line)
+            if not result:
+                continue
+
+            key, value = result.groups()
+
+            if key == 'table':
+                fields = schema.setdefault(value, {})
+            elif key == 'ColumnName' and fields is not None:
+                column = value
+                fields[column] = None
+            elif key == 'DataType' and column:
+                fields[column] = value
+
+    return schema
+
+
+def load_schema(schema_file):
+    """
+    Load the parsed schema from the cache - parsing and caching it if the schema has changed
+    @param schema_file: path to the KE EMu schema
+    @return: dict of module => dict of field name => data type
+    """
+    cache_path = os.path.join(get_cache_dir(), 'schema.%s.json' % get_schema_hash(schema_file))
+
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        pass
+
+    log.info('Parsing schema %s', schema_file)
+    schema = parse_schema(schema_file)
+
+    with atomic_write(cache_path, 'w') as f:
+        json.dump(schema, f)
+
+    return schema
+
+
+class FieldTable(object):
+    """
+    Compiled per field converters and defaults for a module
+
+    Usage:
+
+        table = FieldTable.compile(schema_file, 'emultimedia', {'DnaTotalVolume': 'string'}, {'GenDigitalMediaId': 0})
+        record = table.apply(record)
+
+    """
+
+    def __init__(self, converters, defaults):
+        """
+        @param converters: list of (field name, converter function)
+        @param defaults: list of (field name, default value)
+        """
+        self.converters = converters
+        self.defaults = defaults
+
+    @classmethod
+    def compile(cls, schema_file, module, field_converters, field_defaults):
+        """
+        Compile converters and defaults for a module, checking the fields against the schema
+        @param schema_file: path to the KE EMu schema
+        @param module: KE EMu module name
+        @param field_converters: dict of field name => converter name (see CONVERTERS) or function
+        @param field_defaults: dict of field name => value to use if the field is missing
+        @return: FieldTable
+        """
+        converters = []
+        defaults = []
+
+        if field_converters or field_defaults:
+            fields = load_schema(schema_file).get(module, {})
+
+            for field in set(field_converters) | set(field_defaults):
+                if field not in fields:
+                    log.warning('Field %s is not in the %s schema', field, module)
+
+            for field, converter in sorted(field_converters.items()):
+                converters.append((field, CONVERTERS[converter] if isinstance(converter, basestring) else converter))
+
+            defaults = sorted(field_defaults.items())
+
+        return cls(converters, defaults)
+
+    def apply(self, record):
+        """
+        Convert and fill in the default values of a record in place
+        @param record: dict
+        @return: record
+        """
+        for field, converter in self.converters:
+            if field in record:
+                record[field] = converter(record[field])
+
+        for field, default in self.defaults:
+            if field not in record:
+                record[field] = default
+
+        return record
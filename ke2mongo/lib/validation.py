@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Declarative validation rules for records, compiled once per task
+
+Each rule checks one field, and has a name used to count the records it rejects.
+Rules are checked in order, and a record is rejected by the first rule it fails.
+
+Usage:
+
+    validator = RecordValidator([
+        Exclude('ColRecordType', ['Missing', 'Tissue'], default='Missing'),
+        Required('ColDepartment'),
+    ])
+
+    rule = validator.validate(record)
+
+"""
+
+import re
+import logging
+from uuid import UUID
+from collections import Counter
+
+# Canonical GUID format - anything else is checked with UUID(), which accepts other formats
+GUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+
+def is_valid_guid(guid):
+    """
+    Is guid a valid UUID - equivalent to UUID(guid) not raising a ValueError
+    @param guid: str
+    @return: bool
+    """
+    if GUID_PATTERN.match(guid):
+        return True
+
+    try:
+        UUID(guid)
+    except ValueError:
+        return False
+
+    return True
+
+
+class Rule(object):
+    """
+    Base validation rule - subclasses implement check()
+    """
+
+    # Default rejection name - field name is appended
+    reason = None
+
+    def __init__(self, field, name=None, level=logging.DEBUG):
+        """
+        @param field: field to check
+        @param name: name rejections are counted under
+        @param level: level rejected records are logged at
+        """
+        self.field = field
+        self.name = name or '%s_%s' % (self.reason, field)
+        self.level = level
+
+    def check(self, record):
+        """
+        @param record: dict
+        @return: True if the record is valid
+        """
+        raise NotImplementedError
+
+
+class Exclude(Rule):
+    """
+    Reject records with a field value in a set of excluded values
+    """
+
+    reason = 'excluded'
+
+    def __init__(self, field, values, default=None, name=None, level=logging.DEBUG):
+        super(Exclude, self).__init__(field, name, level)
+        self.values = frozenset(values)
+        self.default = default
+
+    def check(self, record):
+        return record.get(self.field, self.default) not in self.values
+
+
+class Required(Rule):
+    """
+    Reject records without a value for the field
+    """
+
+    reason = 'missing'
+
+    def check(self, record):
+        return bool(record.get(self.field))
+
+
+class Length(Rule):
+    """
+    Reject records without a value of the given length for the field
+    """
+
+    reason = 'invalid'
+
+    def __init__(self, field, length, name=None, level=logging.DEBUG):
+        super(Length, self).__init__(field, name, level)
+        self.length = length
+
+    def check(self, record):
+        value = record.get(self.field)
+        return bool(value) and len(value) == self.length
+
+
+class GUID(Rule):
+    """
+    Reject records with an invalid GUID - records without a GUID are valid
+    """
+
+    reason = 'invalid'
+
+    def check(self, record):
+        value = record.get(self.field)
+        return not value or is_valid_guid(value)
+
+
+class RecordValidator(object):
+    """
+    Validate records against a list of rules, counting the records each rule rejects
+    Counts are for the records validated in this process - see MongoTask.add_rejected_counts()
+    for totalling them across processes
+    """
+
+    def __init__(self, rules):
+        """
+        @param rules: list of Rule
+        """
+        self.rules = [(rule, rule.check) for rule in rules]
+        self.counts = Counter()
+
+    def validate(self, record):
+        """
+        @param record: dict
+        @return: the rule that rejected the record, or None if it's valid
+        """
+        for rule, check in self.rules:
+            if not check(record):
+                self.counts[rule.name] += 1
+                return rule
+
+        return None
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Batching records and writing them to mongo - see BatchWriter
+
+"""
+
+import sys
+import time
+import hashlib
+import datetime
+import threading
+from Queue import Queue
+from collections import Counter, deque
+from ke2mongo.log import log
+
+
+def estimate_bson_size(value):
+    """
+    Estimate the encoded BSON size of a value in bytes
+    This is much cheaper than encoding - and close enough for sizing batches
+    @param value: record or field value
+    @return: int
+    """
+    if isinstance(value, dict):
+        # Document length + terminator, and for each element a type byte, key and terminator
+        return 5 + sum(len(k) + 2 + estimate_bson_size(v) for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        # Arrays are documents keyed by index
+        return 5 + sum(len(str(i)) + 2 + estimate_bson_size(v) for i, v in enumerate(value))
+    elif isinstance(value, str):
+        return len(value) + 5
+    elif isinstance(value, unicode):
+        return len(value.encode('utf-8')) + 5
+    elif isinstance(value, bool) or value is None:
+        return 1
+    elif isinstance(value, (int, long, float, datetime.datetime)):
+        return 8
+    else:
+        return len(str(value)) + 5
+
+
+def get_record_hash(record, excluded_fields=()):
+    """
+    Stable hash of a record's contents - keys are sorted, so it doesn't depend on dict order
+    @param record: dict
+    @param excluded_fields: top level fields to exclude from the hash
+    @return: hex digest
+    """
+    h = hashlib.md5()
+
+    def _update(value):
+        if isinstance(value, dict):
+            h.update('{')
+            for k in sorted(value):
+                h.update(repr(k))
+                _update(value[k])
+            h.update('}')
+        elif isinstance(value, (list, tuple)):
+            h.update('[')
+            for v in value:
+                _update(v)
+            h.update(']')
+        else:
+            h.update(repr(value))
+
+    _update(dict((k, v) for k, v in record.iteritems() if k not in excluded_fields))
+
+    return h.hexdigest()
+
+
+def normalise_value(value):
+    """
+    Normalise a value the way it's stored in mongo, so it can be compared with one read back
+    Tuples are stored as lists, and strings read back as unicode
+    @param value: record field value
+    @return: normalised value
+    """
+    if isinstance(value, (list, tuple)):
+        return [normalise_value(v) for v in value]
+    elif isinstance(value, dict):
+        return dict((k, normalise_value(v)) for k, v in value.iteritems())
+    elif isinstance(value, str):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value
+
+    return value
+
+
+def get_record_diff(existing, record):
+    """
+    Get the update to turn an existing record into record - $set for changed and new fields, $unset for removed fields
+    @param existing: record as stored
+    @param record: new version of the record
+    @return: update dict, empty if nothing has changed
+    """
+    update = {}
+
+    changed = dict((k, v) for k, v in record.iteritems() if k not in existing or normalise_value(existing[k]) != normalise_value(v))
+    removed = dict((k, '') for k in existing if k not in record and k != '_id')
+
+    if changed:
+        update['$set'] = changed
+
+    if removed:
+        update['$unset'] = removed
+
+    return update
+
+
+class IRNSet(object):
+    """
+    Compact set of IRNs - a bitmap, one bit per IRN
+    """
+
+    def __init__(self, size=1024 * 1024):
+        self.bits = bytearray(size)
+
+    def add(self, irn):
+        i = irn >> 3
+        if i >= len(self.bits):
+            self.bits.extend(bytearray(max(i + 1, len(self.bits) * 2) - len(self.bits)))
+        self.bits[i] |= 1 << (irn & 7)
+
+    def __contains__(self, irn):
+        i = irn >> 3
+        return i < len(self.bits) and bool(self.bits[i] & (1 << (irn & 7)))
+
+
+class BatchWriter(object):
+    """
+    Producer / consumer pipeline for writing records to mongo
+
+    Records are collected into batches - a batch is written when it reaches batch_size
+    records, or batch_bytes estimated BSON size, whichever comes first. Batches are
+    written by one or more writer threads, so the export file can continue to be
+    parsed while waiting on mongo. Each writer
+    thread has its own mongo connection, and a bounded queue - if mongo falls behind,
+    add() will block until the writer has caught up.
+
+    Records are routed to a writer by _id, so all versions of the same record are
+    written by the same thread in the order they were added.
+
+    If a write_duplicates function is passed in, the writer keeps track of the _ids
+    (IRNs) it's seen. A duplicate of a record in the batch being built replaces it,
+    so the last one wins. A duplicate of a record in an earlier batch is written with
+    write_duplicates (eg. an upsert) after the batch - so write_batch can be a plain
+    insert that will never hit a duplicate key error.
+
+    If a checkpoint function is passed in, each record must be added with its position -
+    the byte offset of the end of the record in the export file. After each batch is
+    written, checkpoint(position, irn) is called with the offset up to which every
+    record has been written, so an import can be resumed from there.
+
+    Usage:
+
+        with BatchWriter(write_batch, get_collection, batch_size=1000) as writer:
+            for record in records:
+                writer.add(record)
+
+    """
+
+    # Sentinel put on the queues to tell the writer threads to finish
+    _stop = object()
+
+    def __init__(self, write_batch, get_collection, batch_size, batch_bytes=None, writers=1, queue_size=2, checkpoint=None, position=0, write_duplicates=None):
+        """
+        @param write_batch: function(collection, batch) to write a batch of records, returning a dict of counts
+        @param get_collection: function returning a new mongo collection object
+        @param batch_size: maximum number of records per batch
+        @param batch_bytes: maximum estimated BSON size of a batch in bytes
+        @param writers: number of writer threads
+        @param queue_size: number of batches each writer can have waiting
+        @param checkpoint: function(position, irn) called when records up to position have been written
+        @param position: start position, if checkpointing
+        @param write_duplicates: function(collection, batch) to write records duplicating one in an earlier batch
+        """
+        self.write_batch = write_batch
+        self.get_collection = get_collection
+        self.batch_size = max(batch_size or 1, 1)
+        self.batch_bytes = batch_bytes
+        self.error = None
+
+        writers = max(writers, 1)
+        self.queues = [Queue(maxsize=queue_size) for _ in range(writers)]
+        self.batches = [[] for _ in range(writers)]
+        self.duplicates = [[] for _ in range(writers)]
+        self.sizes = [0] * writers
+        # Each writer keeps its own counts, which are totalled on close()
+        self.writer_counts = [Counter() for _ in range(writers)]
+        self.counts = Counter()
+
+        self.write_duplicates = write_duplicates
+        self.seen = IRNSet() if write_duplicates else None
+        # Location (list, index) of each record in the batches being built, by _id
+        self.locations = [{} for _ in range(writers)]
+        self.duplicate_count = 0
+
+        self.checkpoint = checkpoint
+        self.position = self.checkpoint_position = position
+        # Start positions of each writer's unwritten batches
+        self.pending = [deque() for _ in range(writers)]
+        self.lock = threading.Lock()
+
+        self.threads = [threading.Thread(target=self._write, args=(i,)) for i in range(writers)]
+
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def add(self, record, position=None):
+        _id = record['_id']
+        i = hash(_id) % len(self.queues)
+
+        if self.checkpoint:
+            with self.lock:
+                # If this starts a new batch, its start position is the end of the last record added
+                if not self.batches[i] and not self.duplicates[i]:
+                    self.pending[i].append(self.position)
+                self.position = position
+
+        if self.seen is None:
+            self.batches[i].append(record)
+        else:
+            location = self.locations[i].get(_id)
+
+            if location:
+                # Already in the batch - replace it, so the last one wins
+                batch, j = location
+                batch[j] = record
+                self.duplicate_count += 1
+            else:
+                # If it's been in an earlier batch, it needs writing as a duplicate
+                if _id in self.seen:
+                    batch = self.duplicates[i]
+                    self.duplicate_count += 1
+                else:
+                    batch = self.batches[i]
+                    self.seen.add(_id)
+
+                self.locations[i][_id] = (batch, len(batch))
+                batch.append(record)
+
+        if self.batch_bytes:
+            self.sizes[i] += estimate_bson_size(record)
+
+        # If the batch is full, pass it to the writer and start a new batch
+        if len(self.batches[i]) + len(self.duplicates[i]) >= self.batch_size or (self.batch_bytes and self.sizes[i] >= self.batch_bytes):
+            self._flush(i)
+
+    def _flush(self, i):
+        self._raise_error()
+        self.queues[i].put((self.batches[i], self.duplicates[i], self.sizes[i]))
+        self.batches[i] = []
+        self.duplicates[i] = []
+        self.locations[i] = {}
+        self.sizes[i] = 0
+
+    def _write(self, i):
+        """
+        Writer thread - write batches from the queue until stopped
+        """
+        queue = self.queues[i]
+        counts = self.writer_counts[i]
+        collection = None
+
+        while True:
+            item = queue.get()
+
+            if item is self._stop:
+                break
+
+            # If there's been an error, keep emptying the queue so the producer isn't blocked
+            if self.error:
+                continue
+
+            batch, duplicates, size = item
+            t = time.time()
+
+            try:
+                # Got in the try, so a connection error is raised in the producer - rather than killing the thread
+                if collection is None:
+                    collection = self.get_collection()
+                if batch:
+                    counts.update(self.write_batch(collection, batch) or {})
+                if duplicates:
+                    counts.update(self.write_duplicates(collection, duplicates) or {})
+                if self.checkpoint:
+                    self._checkpoint(i, (duplicates or batch)[-1]['_id'])
+            except Exception:
+                self.error = sys.exc_info()
+            else:
+                if size:
+                    log.info('Wrote batch of %s records (%.2f MB) in %.2f sec', len(batch) + len(duplicates), size / 1048576.0, time.time() - t)
+                else:
+                    log.info('Wrote batch of %s records in %.2f sec', len(batch) + len(duplicates), time.time() - t)
+
+    def _checkpoint(self, i, irn):
+        """
+        Batch written by writer i - work out the position up to which all records have been written
+        This is the start of the earliest unwritten batch, or if none are waiting, the last record added
+        """
+        with self.lock:
+            self.pending[i].popleft()
+            unwritten = [pending[0] for pending in self.pending if pending]
+            position = min(unwritten) if unwritten else self.position
+
+            if position > self.checkpoint_position:
+                self.checkpoint(position, irn)
+                self.checkpoint_position = position
+
+    def _raise_error(self):
+        """
+        Re-raise any exception from the writer threads in the producer thread
+        """
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def _join(self):
+        for queue in self.queues:
+            queue.put(self._stop)
+
+        for thread in self.threads:
+            thread.join()
+
+    def close(self):
+        """
+        Write any remaining records, and wait for the writers to finish
+        """
+        # Add any records remaining in the batches
+        for i, batch in enumerate(self.batches):
+            if batch or self.duplicates[i]:
+                self._flush(i)
+
+        self._join()
+        self._raise_error()
+        self.counts = sum(self.writer_counts, Counter())
+        self.counts['duplicates'] = self.duplicate_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            # Do not write the remaining batches, but make sure the threads finish
+            self._join()
+        else:
+            self.close()
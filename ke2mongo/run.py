@@ -12,6 +12,12 @@ If running manually, you may want to run without rebuilding the solr specimen in
 
 python run.py -l --no-index
 
+To import the KE EMu modules concurrently, set the number of luigi workers:
+
+python run.py -l --workers 6
+
+To limit how many of them write to mongo at once, set the mongo writers resource in the luigi config - see tasks/mongo_import.py
+
 """
 
 import sys
@@ -59,13 +65,17 @@ def main(argv):
     local_scheduler = False
     # And if we don't want to rebuild the indexes after run
     no_index = False
+    # Number of tasks to run concurrently
+    workers = 1
 
-    opts, args = getopt.getopt(argv, "ln", ["local-scheduler", "no-index"])
+    opts, args = getopt.getopt(argv, "lnw:", ["local-scheduler", "no-index", "workers="])
     for opt, arg in opts:
         if opt in ("-l", "--local-scheduler"):
             local_scheduler = True
         if opt in ("-n", "--no-index"):
             no_index = True
+        if opt in ("-w", "--workers"):
+            workers = int(arg)
 
     if export_file_date:
         params = ['--date', str(export_file_date)]
@@ -73,6 +83,9 @@ def main(argv):
         if no_index:
             params.append('--no-index')
 
+        if workers > 1:
+            params += ['--workers', str(workers)]
+
         luigi.run(params, main_task_cls=MainTask, local_scheduler=local_scheduler)
 
 if __name__ == "__main__":
@@ -7,12 +7,18 @@ Copyright (c) 2013 'bens3'. All rights reserved.
 
 import os
 import luigi.postgres
-from luigi.format import Gzip
+from contextlib import contextmanager
+from ke2mongo.log import log
+from ke2mongo.lib.file import ExportFileReader, decompress_export_file
+from ke2mongo.lib.compression import get_export_formats
 
 class KEFileTarget(luigi.LocalTarget):
 
     file_name = None
     is_tmp = False
+    # Format the file is compressed with, or None if it's not compressed
+    # LocalTarget replaces a None format with NopFormat - so use this, not format, to check for compression
+    compression = None
 
     def __init__(self, export_dir, module, date, file_extension):
         """
@@ -22,13 +28,43 @@ class KEFileTarget(luigi.LocalTarget):
         self.module = module
         self.date = date
         self.file_extension = file_extension
-        path, self.file_name, self.format = self.get_file()
-        super(KEFileTarget, self).__init__(path, self.format)
+        path, self.file_name, self.compression = self.get_file()
+        super(KEFileTarget, self).__init__(path, self.compression)
+
+    def open_reader(self):
+        """
+        Open the export file for parsing, with a reader that tracks the byte offset
+        @return: ExportFileReader
+        """
+        if self.compression:
+            return ExportFileReader(self.open('r'))
+
+        return ExportFileReader(open(self.path, 'rb'))
+
+    @contextmanager
+    def uncompressed_path(self):
+        """
+        Get the path of the export file uncompressed, so it can be split into byte ranges
+        Compressed files are decompressed to a temporary file, removed on exit - uncompressed files are used in place
+        @return: path
+        """
+        if not self.compression:
+            yield self.path
+            return
+
+        log.info('Decompressing %s', self.file_name)
+        tmp_path = decompress_export_file(self.path)
+
+        try:
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
 
     def get_file(self):
         """
-        Loop through file and file.gz and return the one that exists
-        If neither exists, raise an Exception
+        Loop through the file and its compressed versions (file.gz etc.,) and return the one that exists
+        The format used to decompress the file is selected from its extension
+        If none exist, raise an Exception
         """
 
         file_name_parts = [self.module, self.file_extension]
@@ -38,10 +74,7 @@ class KEFileTarget(luigi.LocalTarget):
         file_name = '.'.join(file_name_parts)
 
         # List of candidate files and types to try
-        candidate_files = [
-            (file_name, None),
-            ('%s.gz' % file_name, Gzip)
-        ]
+        candidate_files = [(file_name + extension, format) for extension, format in get_export_formats()]
 
         for candidate_file, format in candidate_files:
             path = os.path.join(self.export_dir, candidate_file)
@@ -50,4 +83,4 @@ class KEFileTarget(luigi.LocalTarget):
 
         # If the file doesn't exist we want to raise an Exception
         # If a file doesn't exist it hasn't been included in the export and needs to be investigated
-        raise IOError('Export files could not be found: Tried: %s %s.gz' % (os.path.join(self.export_dir, file_name), os.path.join(self.export_dir, file_name)))
\ No newline at end of file
+        raise IOError('Export files could not be found: Tried: %s' % ' '.join(os.path.join(self.export_dir, candidate_file) for candidate_file, _ in candidate_files))
@@ -12,6 +12,8 @@ from ke2mongo.lib.mongo import mongo_client_db, mongo_get_marker_collection_name
 class MongoTarget(luigi.Target):
 
     marker_collection_name = mongo_get_marker_collection_name()
+    # Import progress is checkpointed in a collection alongside the markers
+    checkpoint_collection_name = '%s_checkpoints' % marker_collection_name
 
     def __init__(self, database, update_id):
 
@@ -20,6 +22,7 @@ class MongoTarget(luigi.Target):
         self.db = mongo_client_db(database)
         # Use the postgres table name for the collection
         self.marker_collection = self.get_collection(self.marker_collection_name)
+        self.checkpoint_collection = self.get_collection(self.checkpoint_collection_name)
 
     def get_collection(self, collection):
         return self.db[collection]
@@ -31,8 +34,40 @@ class MongoTarget(luigi.Target):
         exists = self.marker_collection.find({'update_id': self.update_id}).count()
         return bool(exists)
 
-    def touch(self):
+    def touch(self, **fields):
         """
         Mark this update as complete.
+        Whatever write concern the import used, the marker must be durable - so wait for a journaled majority
+        @param fields: any extra fields to store in the marker
         """
-        self.marker_collection.insert({'update_id': self.update_id, 'inserted': datetime.datetime.now()})
\ No newline at end of file
+        marker = {'update_id': self.update_id, 'inserted': datetime.datetime.now()}
+        marker.update(fields)
+        self.marker_collection.insert(marker, w='majority', j=True)
+
+    def get_checkpoint(self, start=0):
+        """
+        Get the checkpoint for an import starting at byte offset start
+        @param start: start offset of the file / file range being imported
+        @return: dict with offset, irn and batches; or None
+        """
+        return self.checkpoint_collection.find_one({'update_id': self.update_id, 'start': start})
+
+    def checkpoint(self, start, offset, irn):
+        """
+        Record that everything up to offset has been committed
+        @param start: start offset of the file / file range being imported
+        @param offset: byte offset in the export file up to which all records have been written
+        @param irn: last irn written
+        @return: None
+        """
+        self.checkpoint_collection.update(
+            {'update_id': self.update_id, 'start': start},
+            {'$set': {'offset': offset, 'irn': irn, 'updated': datetime.datetime.now()}, '$inc': {'batches': 1}},
+            upsert=True
+        )
+
+    def clear_checkpoints(self):
+        """
+        Remove all checkpoints for this update
+        """
+        self.checkpoint_collection.remove({'update_id': self.update_id})
@@ -4,32 +4,127 @@
 Created by 'bens3' on 2013-06-21.
 Copyright (c) 2013 'bens3'. All rights reserved.
 
-"""
+Re-flag catalogue records as CITES, after the cites collection has been updated
+
+python tasks/cites.py --local-scheduler
 
+Only records with scientific names added to or removed from the matched CITES names since
+the last run are updated - the names flagged by each run are stored in the cites_flagged collection.
+
+"""
 
+import time
 import luigi
 from ke2mongo.log import log
 from ke2mongo.lib.timeit import timeit
-from ke2mongo.lib.cites import get_cites_species
+from ke2mongo.lib.cites import get_cites_matcher, CITES_COLLECTION
 from ke2mongo.tasks.mongo_catalogue import MongoCatalogueTask
 from ke2mongo.lib.mongo import mongo_client_db
 
+# Catalogue scientific names flagged as CITES by the last run
+CITES_FLAGGED_COLLECTION = '%s_flagged' % CITES_COLLECTION
+
 
 class CitesTask(luigi.Task):
 
     """
     Very basic task to update ecatalogue records with sites data
     """
+
+    # Number of names per $in query
+    chunk_size = 500
+
+    @staticmethod
+    def get_distinct_names(collection, query=None):
+        """
+        Get the distinct scientific names of the catalogue records
+        Uses an aggregation cursor rather than distinct(), which fails if the names exceed the 16MB document limit
+        @param collection: catalogue collection
+        @param query: records to include
+        @return: iterator of names
+        """
+        pipeline = []
+
+        if query:
+            pipeline.append({'$match': query})
+
+        pipeline.append({'$group': {'_id': '$DarScientificName'}})
+
+        for r in collection.aggregate(pipeline, allowDiskUse=True, cursor={}):
+            yield r['_id']
+
+    def get_flagged_names(self, mongo_db, collection):
+        """
+        Get the scientific names flagged as CITES by the last run
+        On the first run, use the names of the records currently flagged
+        @return: set of names
+        """
+        names = set(r['_id'] for r in mongo_db[CITES_FLAGGED_COLLECTION].find())
+
+        if not names:
+            names = set(name for name in self.get_distinct_names(mongo_db[collection], {'cites': True}) if name)
+
+        return names
+
+    def update_chunks(self, collection, names, query, update):
+        """
+        Update the records with scientific names in names, in chunks of chunk_size names
+        @param collection: catalogue collection
+        @param names: list of names
+        @param query: extra query criteria
+        @param update: update document
+        @return: number of records modified
+        """
+        total = 0
+
+        for i in range(0, len(names), self.chunk_size):
+            chunk = names[i:i + self.chunk_size]
+            chunk_query = {'DarScientificName': {'$in': chunk}}
+            chunk_query.update(query)
+
+            t = time.time()
+            result = collection.update(chunk_query, update, multi=True)
+            modified = result.get('nModified', result.get('n', 0))
+            total += modified
+
+            log.info('CITES: %s names, %s records modified in %.2f sec', len(chunk), modified, time.time() - t)
+
+        return total
+
     @timeit
     def run(self):
 
         mongo_db = mongo_client_db()
-        collection = MongoCatalogueTask(date=None).collection_name
-        cites_species = get_cites_species()
+        collection_name = MongoCatalogueTask(date=None).collection_name
+        collection = mongo_db[collection_name]
+
+        # The name updates use the index
+        collection.ensure_index('DarScientificName')
+
+        matcher = get_cites_matcher()
+
+        # Match the distinct scientific names, rather than every record - using the same matcher as MongoCatalogueTask
+        names = set(name for name in self.get_distinct_names(collection) if name and matcher.match(name.encode('utf8')))
+        previous_names = self.get_flagged_names(mongo_db, collection_name)
+
+        added = sorted(names - previous_names)
+        removed = sorted(previous_names - names)
+
+        log.info('CITES: %s names added, %s names removed', len(added), len(removed))
 
         # Set cites=true flag
-        cites_records_cursor = mongo_db[collection].update({'DarScientificName': {'$in': cites_species}}, {'$set': {'cites': True}}, multi=True)
-        log.info('Updated %s catalogue records as CITES', cites_records_cursor['nModified'])
+        flagged = self.update_chunks(collection, added, {}, {'$set': {'cites': True}})
+        unflagged = self.update_chunks(collection, removed, {'cites': True}, {'$unset': {'cites': ''}})
+
+        log.info('Updated %s catalogue records as CITES, %s records no longer CITES', flagged, unflagged)
+
+        # Store the flagged names for the next run
+        mongo_db[CITES_FLAGGED_COLLECTION].drop()
+
+        sorted_names = sorted(names)
+
+        for i in range(0, len(sorted_names), self.chunk_size):
+            mongo_db[CITES_FLAGGED_COLLECTION].insert([{'_id': name} for name in sorted_names[i:i + self.chunk_size]])
 
 if __name__ == '__main__':
-    luigi.run(main_task_cls=CitesTask)
\ No newline at end of file
+    luigi.run(main_task_cls=CitesTask)
@@ -28,12 +28,14 @@ from ke2mongo.tasks.mongo_multimedia import MongoMultimediaTask
 from ke2mongo.tasks.mongo_collection_index import MongoCollectionIndexTask
 from ke2mongo.tasks.mongo_collection_event import MongoCollectionEventTask
 from ke2mongo.tasks.mongo_site import MongoSiteTask
+from ke2mongo.tasks.mongo_import import MongoImportTask
+from ke2mongo.tasks.mongo_denormalise import MongoDenormaliseTask, DENORMALISED_COLLECTIONS
 from ke2mongo.tasks.unpublish import UnpublishTask
 from ke2mongo.tasks.delete import DeleteAPITask
 from ke2mongo.targets.csv import CSVTarget
 from ke2mongo.targets.api import APITarget
 from ke2mongo.targets.mongo import MongoTarget
-from ke2mongo.lib.mongo import mongo_client_db, mongo_get_update_markers
+from ke2mongo.lib.mongo import mongo_client_db, mongo_get_update_markers, mongo_get_denormalise
 from ke2mongo.lib.file import get_export_file_dates
 from ke2mongo.tasks.api import APITask
 
@@ -53,6 +55,9 @@ class DatasetTask(APITask):
 
     has_run = False
 
+    # If set, site and collection event fields are read from the catalogue records - see MongoDenormaliseTask
+    denormalised = mongo_get_denormalise()
+
     @abc.abstractproperty
     def columns(self):
         """
@@ -201,20 +206,20 @@ class DatasetTask(APITask):
         assert export_file_dates == update_marker_dates, 'Outstanding previous export file dates need to be processed first: %s' % list(set(export_file_dates) - set(update_marker_dates))
 
     def requires(self):
-        return [
+        requirements = [
             # DeleteTask depends upon all other mongo tasks, but lets add them in anyway so it's
             # obvious what's happening here
-            MongoCatalogueTask(date=self.date),
-            MongoTaxonomyTask(self.date),
-            MongoMultimediaTask(self.date),
-            MongoCollectionIndexTask(self.date),
-            MongoCollectionEventTask(self.date),
-            MongoSiteTask(self.date),
+            MongoImportTask(date=self.date),
             DeleteAPITask(date=self.date),
             # Removed unpublished - once published, a record cannot be marked as hidden
             # UnpublishTask(date=self.date)
         ]
 
+        if self.denormalised:
+            requirements.append(MongoDenormaliseTask(date=self.date))
+
+        return requirements
+
 
     def get_or_create_resource(self):
         """
@@ -342,6 +347,10 @@ class DatasetTask(APITask):
             field_collection, field_name = source_field.split('.')
             field_type = self.ckan_to_numpy_type(field_type)
 
+            # Denormalised fields are read from the sub document embedded in the catalogue record
+            if self.is_denormalised_field(source_field):
+                field_collection, field_name = self.collection_name, source_field
+
             try:
                 collection_columns[field_collection].append((field_name, destination_field, field_type))
             except KeyError:
@@ -352,6 +361,14 @@ class DatasetTask(APITask):
         else:
             return collection_columns
 
+    def is_denormalised_field(self, source_field):
+        """
+        Is the field embedded in the catalogue records - see MongoDenormaliseTask
+        @param source_field: collection.field
+        @return: bool
+        """
+        return self.denormalised and source_field.split('.')[0] in DENORMALISED_COLLECTIONS
+
     @timeit
     def run(self):
         count = 0
@@ -441,54 +458,21 @@ class DatasetTask(APITask):
         # Get a unique list of IRNS
         unique_multimedia_irns = list(set(itertools.chain(*[irn for irn in df[multimedia_field].values])))
 
-        # Get a list of dictionary of valid multimedia valid mimetypes
-        # It's not enough to just check for the derived image heights - some of these are tiffs etc., and undeliverable
+        # Publishable images, and their media entries, are set on import - see lib.multimedia.get_publishable_fields()
+        # Embargoed images have an embargo date after today
         cursor = mongo_client['emultimedia'].find(
             {
                 '_id': {'$in': unique_multimedia_irns},
-                'AdmPublishWebNoPasswordFlag': 'Y',
-                #'NhmSecEmbargoDate': 0,
-                'GenDigitalMediaId': {'$ne': 0}
-                },
+                'isPublishableImage': True,
+                'publishableFrom': {'$lte': datetime.datetime.today().strftime("%Y-%m-%d")}
+            },
             {
-                'GenDigitalMediaId': 1,
-                'MulTitle': 1,
-                'MulMimeFormat': 1,
-		'NhmSecEmbargoDate': 1,
-		'NhmSecEmbargoExtensionDate': 1
+                'media': 1
             }
         )
 
         # Create a dictionary of multimedia records, keyed by _id
-        multimedia_dict = {}
-
-        for record in cursor:
-
-            if record['GenDigitalMediaId'] == 'Pending':
-                continue
-
-	    # If the embargo extension date exists and is in the future, then skip
-	    if 'NhmSecEmbargoExtensionDate' in record: 
-	    	if record['NhmSecEmbargoExtensionDate'] > 0 and record['NhmSecEmbargoExtensionDate'] > datetime.datetime.today().strftime("%Y-%m-%d"):
-			continue
-
-	    # For remaining records, if the original embargo date exists and is in the future then skip
-	    if record['NhmSecEmbargoDate'] > 0 and record['NhmSecEmbargoDate'] > datetime.datetime.today().strftime("%Y-%m-%d"):
-		continue
-		
-            multimedia_dict[record['_id']] = {
-                'identifier': 'http://www.nhm.ac.uk/services/media-store/asset/{mam_id}/contents/preview'.format(
-                    mam_id=record['GenDigitalMediaId'],
-                ),
-                'format': 'image/%s' % record['MulMimeFormat'],
-                "type": "StillImage",
-                "license": "http://creativecommons.org/licenses/by/4.0/",
-                "rightsHolder": "The Trustees of the Natural History Museum, London"
-            }
-
-            # Add the title if it exists
-            if record.get('MulTitle', None):
-                multimedia_dict[record['_id']]['title'] = record.get('MulTitle')
+        multimedia_dict = dict((record['_id'], record['media']) for record in cursor)
 
         def multimedia_to_json(irns):
             """
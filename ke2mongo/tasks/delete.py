@@ -23,6 +23,7 @@ from ke2mongo.tasks.mongo_collection_event import MongoCollectionEventTask
 from ke2mongo.tasks.mongo_site import MongoSiteTask
 from ke2mongo.tasks.mongo_site import MongoSiteTask
 from ke2mongo.tasks.mongo_delete import MongoDeleteTask
+from ke2mongo.tasks.mongo_import import MongoImportTask
 from ke2mongo.tasks.ke import KEFileTask
 
 
@@ -41,14 +42,7 @@ class DeleteAPITask(APITask, MongoDeleteTask):
 
         # For delete to run, all other mongo tasks for same date must have already run
         # As on delete we also remove from MongoDB
-        return [
-            MongoCatalogueTask(date=self.date),
-            MongoTaxonomyTask(self.date),
-            MongoMultimediaTask(self.date),
-            MongoCollectionIndexTask(self.date),
-            MongoCollectionEventTask(self.date),
-            MongoSiteTask(self.date),
-        ]
+        return MongoImportTask(date=self.date)
 
     def input(self):
         """
@@ -71,7 +65,7 @@ class DeleteAPITask(APITask, MongoDeleteTask):
         if collection.name == 'ecatalogue':
 
             # Load the record from mongo
-            mongo_record = collection.find_one({'_id': int(irn)})
+            mongo_record = collection.find_one(self.get_delete_query(int(irn)))
 
             if mongo_record:
                 ckan_delete(self.remote_ckan, mongo_record)
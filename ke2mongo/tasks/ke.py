@@ -5,9 +5,13 @@ Created by 'bens3' on 2013-06-21.
 Copyright (c) 2013 'bens3'. All rights reserved.
 """
 
+import os
 import luigi.postgres
 from ke2mongo import config
+from ke2mongo.log import log
 from ke2mongo.targets.ke import KEFileTarget
+from ke2mongo.lib.file import get_chunk_dir, get_export_file_ranges
+from ke2mongo.lib.index import ExportFileIndex
 
 
 class KEFileTask(luigi.ExternalTask):
@@ -23,4 +27,79 @@ class KEFileTask(luigi.ExternalTask):
 
     def output(self):
         export_dir = config.get('keemu', 'export_dir')
-        return KEFileTarget(export_dir, self.module, self.date, self.file_extension)
\ No newline at end of file
+        return KEFileTarget(export_dir, self.module, self.date, self.file_extension)
+
+
+class KESplitTask(luigi.Task):
+    """
+    Split an export file into chunk files at record boundaries - see MongoChunkTask
+    Compressed export files are decompressed first, so the chunk files are uncompressed
+    """
+
+    module = luigi.Parameter()
+    file_extension = luigi.Parameter()
+    date = luigi.IntParameter(default=None)
+    chunks = luigi.IntParameter()
+
+    # Size of reads when copying chunks
+    copy_size = 16 * 1024 * 1024
+
+    def requires(self):
+        return KEFileTask(module=self.module, file_extension=self.file_extension, date=self.date)
+
+    def output(self):
+        file_name = '.'.join([self.module, self.file_extension, str(self.date)])
+        return [luigi.LocalTarget(os.path.join(get_chunk_dir(), '%s.chunk%03dof%03d' % (file_name, chunk, self.chunks))) for chunk in range(self.chunks)]
+
+    def run(self):
+        # Compressed files cannot be split - so are decompressed first
+        with self.input().uncompressed_path() as path:
+            # If the export file has been indexed, use it for the split points - otherwise scan the file
+            index = ExportFileIndex(self.input().path)
+
+            if index.is_current():
+                ranges = index.get_ranges(self.chunks, os.path.getsize(path))
+            else:
+                ranges = get_export_file_ranges(path, self.chunks)
+
+            # Small files may have fewer ranges than chunks - the rest of the chunks are empty
+            ranges += [(0, 0)] * (self.chunks - len(ranges))
+
+            log.info('Splitting %s into %s chunks', self.input().file_name, self.chunks)
+
+            chunk_dir = get_chunk_dir()
+
+            if not os.path.isdir(chunk_dir):
+                os.makedirs(chunk_dir)
+
+            with open(path, 'rb') as f:
+                for target, (start, end) in zip(self.output(), ranges):
+                    f.seek(start)
+                    # Written to a temporary file and moved into place on close, so partial chunks are never used
+                    with target.open('w') as out:
+                        remaining = end - start
+                        while remaining > 0:
+                            data = f.read(min(self.copy_size, remaining))
+                            if not data:
+                                break
+                            out.write(data)
+                            remaining -= len(data)
+
+    def remove(self):
+        """
+        Remove the chunk files, and any files stored alongside them
+        @return: None
+        """
+        for target in self.output():
+            for path in [target.path, get_chunk_irns_path(target.path)]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def get_chunk_irns_path(path):
+    """
+    Path of the IRNs written from a chunk file - see MongoChunkTask
+    @param path: chunk file path
+    @return: path
+    """
+    return '%s.irns.npy' % path
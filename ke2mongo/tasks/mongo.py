@@ -8,23 +8,69 @@ Copyright (c) 2013 'bens3'. All rights reserved.
 
 import sys
 import os
+import time
+import datetime
 import luigi
 import abc
+import multiprocessing
+import numpy as np
+from collections import Counter, OrderedDict, defaultdict
+from StringIO import StringIO
 from luigi.parameter import ParameterException
 from keparser import KEParser
 from keparser.parser import FLATTEN_NONE, FLATTEN_SINGLE, FLATTEN_ALL
-from ke2mongo.tasks.ke import KEFileTask
+from ke2mongo.tasks.ke import KEFileTask, KESplitTask, get_chunk_irns_path
 from ke2mongo.log import log
 from ke2mongo import config
 from ke2mongo.lib.timeit import timeit
 from ke2mongo.targets.mongo import MongoTarget
-from pymongo.errors import InvalidOperation, DuplicateKeyError
-from ConfigParser import NoOptionError
+from ke2mongo.lib.file import get_export_file_ranges, get_shard_duplicates, get_full_export_date, ExportFileReader
+from ke2mongo.lib.writer import BatchWriter, get_record_hash, get_record_diff
+from ke2mongo.lib.index import ExportFileIndex
+from ke2mongo.lib.schema import FieldTable
+from ke2mongo.lib.validation import RecordValidator
+from ke2mongo.lib.mongo import mongo_get_batch_bytes, mongo_get_write_profile, mongo_get_writer_resources
+from pymongo.errors import DuplicateKeyError, BulkWriteError, DocumentTooLarge, InvalidDocument, OperationFailure
+from ConfigParser import NoOptionError, NoSectionError
+
+# Write modes - see MongoTask.import_data()
+WRITE_MODE_AUTO = 'auto'
+WRITE_MODE_INSERT = 'insert'
+WRITE_MODE_UPDATE = 'update'
+WRITE_MODE_ROUTE = 'route'
+WRITE_MODE_BULK_LOAD = 'bulk'
+WRITE_MODE_DIFF = 'diff'
+
+# Write profiles used by default - see MongoTask.set_write_profile()
+WRITE_PROFILE_BULK_LOAD = 'bulk_load'
+WRITE_PROFILE_INCREMENTAL = 'incremental'
+
+# Insert errors we can recover from - error code => name, see MongoTask.insert_batch()
+WRITE_ERROR_DUPLICATE_KEY = 'duplicate_key'
+WRITE_ERROR_TOO_LARGE = 'too_large'
+WRITE_ERROR_INVALID_KEY = 'invalid_key'
+
+WRITE_ERRORS = {
+    11000: WRITE_ERROR_DUPLICATE_KEY,
+    11001: WRITE_ERROR_DUPLICATE_KEY,
+    10334: WRITE_ERROR_TOO_LARGE,
+    17419: WRITE_ERROR_TOO_LARGE,
+    52: WRITE_ERROR_INVALID_KEY,  # $ prefixed field name
+    56: WRITE_ERROR_INVALID_KEY,  # Empty field name
+    57: WRITE_ERROR_INVALID_KEY,  # Dotted field name
+}
+
+# Field storing the content hash of each record, and fields excluded from the hash
+# exportFileDate changes on every export, so is excluded - otherwise no record would be unchanged
+# It's still updated on records skipped as unchanged, see MongoTask.touch_records()
+HASH_FIELD = 'recordHash'
+HASH_EXCLUDED_FIELDS = [HASH_FIELD, 'exportFileDate']
+
 
 class InvalidRecordException(Exception):
     """
     Raise an exception for records we want to skip
-    See MongoCatalogueTask.process_record()
+    See MongoTask.prepare_record()
     """
     pass
 
@@ -44,21 +90,90 @@ class FlattenModeParameter(luigi.Parameter):
         return s
 
 
+class WriteModeParameter(luigi.Parameter):
+    """Parameter whose value is one of WRITE_MODE_AUTO, WRITE_MODE_INSERT, WRITE_MODE_UPDATE, WRITE_MODE_ROUTE, WRITE_MODE_BULK_LOAD, WRITE_MODE_DIFF"""
+
+    write_modes = [WRITE_MODE_AUTO, WRITE_MODE_INSERT, WRITE_MODE_UPDATE, WRITE_MODE_ROUTE, WRITE_MODE_BULK_LOAD, WRITE_MODE_DIFF]
+
+    def parse(self, s):
+
+        if not s in self.write_modes:
+            raise ParameterException('Write mode must be one of %s' % ' '.join(self.write_modes))
+
+        return s
+
+
+def _import_shard(args):
+    """
+    Pool worker - recreate the task in the worker process and import one byte range of the export file
+    This needs to be module level so it can be pickled by multiprocessing
+    See MongoTask.import_sharded()
+    """
+    task_cls, param_kwargs, path, start, end, mode = args
+    return task_cls(**param_kwargs).import_shard(path, start, end, mode)
+
+
 class MongoTask(luigi.Task):
 
     date = luigi.IntParameter()
     # Added parameter to allow skipping the processing of records - this is so MW can look at the raw data in mongo
     unprocessed = luigi.BooleanParameter(default=False, significant=False)
     flatten_mode = FlattenModeParameter(default=FLATTEN_ALL, significant=False)
+    # Number of shards to split the export file into, each parsed in its own process - if 1, the file is parsed in serial
+    # Not to be confused with luigi's --workers, the number of tasks run at once
+    shards = luigi.IntParameter(default=1, significant=False)
+    # Number of threads writing to mongo while the export file is being parsed
+    writer_threads = luigi.IntParameter(default=1, significant=False)
+    # How records are written - by default, bulk load the full export into an empty collection,
+    # insert into an empty collection, otherwise route
+    write_mode = WriteModeParameter(default=WRITE_MODE_AUTO, significant=False)
+    # For full export rebuilds - load into a staging collection, and swap it in for the live collection once complete
+    # Only allowed for the full export date, as the swap replaces the whole collection - see check_staging()
+    staging = luigi.BooleanParameter(default=False, significant=False)
+    # Write concern and bulk op profile from the config - by default bulk_load when bulk loading, otherwise incremental
+    write_profile = luigi.Parameter(default=None, significant=False)
+    # Number of chunk files to split the export file into - each chunk is imported by a separate
+    # luigi task (see MongoChunkTask), so chunks can run in parallel and be retried individually
+    # Run with --workers to import chunks concurrently - all at once, unless the mongo writers resource is limited
+    chunks = luigi.IntParameter(default=1, significant=False)
 
     database = config.get('mongo', 'database')
     keemu_schema_file = config.get('keemu', 'schema')
 
+    # Batches are written when they reach the maximum number of records, or batch_bytes estimated size
     batch_size = 1000
     bulk_op_size = 100000
+    batch_bytes = mongo_get_batch_bytes()
     collection = None
     file_extension = 'export'
 
+    # Per field conversions (field name => converter name, see lib.schema.CONVERTERS) and
+    # default values for missing fields - compiled against the schema, and applied to each
+    # record before process_record()
+    field_converters = {}
+    field_defaults = {}
+    _field_table = None
+
+    # Validation rules (see lib.validation) - records failing a rule are skipped before process_record()
+    validation_rules = []
+    _validator = None
+
+    # Indexes to build on the collection - see ensure_indexes()
+    indexes = ['exportFileDate']
+
+    # Set once the staging collection has replaced the live collection
+    _swapped = False
+
+    # Set from the write profile - see set_write_profile()
+    write_concern = {}
+    ordered = False
+
+    # Time the import started - stored in the marker, see MongoImportTask
+    started = None
+
+    # Target import progress is checkpointed to, if not this task's marker - see import_chunk()
+    _checkpoint_target = None
+
     @abc.abstractproperty
     def module(self):
         return None
@@ -67,6 +182,24 @@ class MongoTask(luigi.Task):
     def collection_name(self):
         return self.module  # By default, the collection name will be the same as the module
 
+    @property
+    def resources(self):
+        # Limit the number of tasks writing to mongo at once, when running with multiple luigi workers
+        return mongo_get_writer_resources()
+
+    @property
+    def staging_collection_name(self):
+        return '%s__staging_%s' % (self.collection_name, self.date)
+
+    @property
+    def write_collection_name(self):
+        """
+        Name of the collection records are written to - the staging collection, until it's swapped in
+        """
+        if self.staging and not self._swapped:
+            return self.staging_collection_name
+        return self.collection_name
+
     def requires(self):
         return KEFileTask(module=self.module, date=self.date, file_extension=self.file_extension)
 
@@ -75,99 +208,653 @@ class MongoTask(luigi.Task):
         Get a reference to the mongo collection object
         @return:
         """
-        return self.output().get_collection(self.collection_name)
+        collection = self.output().get_collection(self.write_collection_name)
+
+        if self.write_concern:
+            collection.write_concern = self.write_concern
+
+        return collection
+
+    def set_write_profile(self, mode):
+        """
+        Set the write concern and bulk op ordering from the write profile
+        If a profile isn't selected, use the default for the write mode - if it's in the config
+        @param mode: write mode
+        @return: None
+        """
+        name = self.write_profile
+
+        if not name:
+            name = WRITE_PROFILE_BULK_LOAD if mode == WRITE_MODE_BULK_LOAD else WRITE_PROFILE_INCREMENTAL
+
+        try:
+            profile = mongo_get_write_profile(name)
+        except NoSectionError:
+            # The selected profile must exist
+            if self.write_profile:
+                raise
+            return
+
+        log.info('Using write profile %s: %s', name, profile)
+        self.write_concern = profile['write_concern']
+        self.ordered = profile['ordered']
+
+    def initialize_bulk_op(self, collection):
+        """
+        Start an ordered or unordered bulk op, depending on the write profile
+        """
+        if self.ordered:
+            return collection.initialize_ordered_bulk_op()
+        return collection.initialize_unordered_bulk_op()
+
+    @property
+    def field_table(self):
+        if self._field_table is None:
+            self._field_table = FieldTable.compile(self.keemu_schema_file, self.module, self.field_converters, self.field_defaults)
+        return self._field_table
+
+    @property
+    def validator(self):
+        if self._validator is None:
+            self._validator = RecordValidator(self.validation_rules)
+        return self._validator
+
+    def resolve_write_mode(self):
+        """
+        Get the write mode to use - resolving WRITE_MODE_AUTO
+        @return: write mode
+        """
+        mode = self.write_mode
+
+        if mode == WRITE_MODE_AUTO:
+            # If we have any records in the collection, route each batch between insert and replace
+            # Otherwise if this is the full export, bulk load - or use batch insert
+            if self.get_collection().find_one():
+                mode = WRITE_MODE_ROUTE
+            elif self.date == get_full_export_date():
+                mode = WRITE_MODE_BULK_LOAD
+            else:
+                mode = WRITE_MODE_INSERT
+
+        return mode
 
-    @timeit
     def run(self):
 
-        ke_data = KEParser(self.input().open('r'), file_path=self.input().path, schema_file=self.keemu_schema_file, flatten_mode=self.flatten_mode)
+        self.check_staging()
+
+        # Chunked imports yield the chunk tasks as dynamic dependencies, so return a generator - which cannot be timed
+        if self.chunks > 1:
+            return self.run_chunked()
+
+        self.run_import()
+
+    @timeit
+    def run_import(self):
+        """
+        Import the export file in this task - serially, or in shards
+        @return: None
+        """
+        self.started = datetime.datetime.now()
+
+        mode = self.resolve_write_mode()
+
+        self.set_write_profile(mode)
         self.collection = self.get_collection()
 
-        # If we have any records in the collection, use bulk_update with mongo bulk upsert
-        # Otherwise use batch insert (20% faster than using bulk insert())
-        if self.collection.find_one():
-            self.bulk_update(ke_data)
+        if mode == WRITE_MODE_BULK_LOAD:
+            # Indexes slow down the inserts - so drop them, and build them once all records are loaded
+            log.info('Bulk loading %s: dropping indexes', self.write_collection_name)
+            self.collection.drop_indexes()
+
+        t = time.time()
+
+        if self.shards > 1:
+            counts = self.import_sharded(mode)
         else:
-            self.batch_insert(ke_data)
+            with self.input().open_reader() as reader:
+                self.resume(reader)
+                ke_data = KEParser(reader, file_path=self.input().path, schema_file=self.keemu_schema_file, flatten_mode=self.flatten_mode)
+                counts = self.import_data(self.iterate_data(ke_data), mode, reader)
+
+            self.add_rejected_counts(counts)
+
+        load_time = time.time() - t
+        self.log_write_counts(counts)
+
+        # Build the indexes before the staging collection is swapped in, so it's ready to be queried
+        if mode == WRITE_MODE_BULK_LOAD or self.staging:
+            index_time = self.ensure_indexes()
+            log.info('%s: loaded in %.2f sec, indexes built in %.2f sec', self.input().file_name, load_time, index_time)
+
+        if self.staging:
+            self.swap_staging_collection()
+
+        self.mark_complete()
+
+    def check_staging(self):
+        """
+        Swapping in the staging collection replaces the live collection with just the records in this
+        export file - so staging is only allowed when importing the full export
+        @return: None
+        """
+        if self.staging and self.date != get_full_export_date():
+            raise ParameterException('Staging is only allowed for the full export (%s) - not %s' % (get_full_export_date(), self.date))
+
+    def swap_staging_collection(self):
+        """
+        Replace the live collection with the staging collection
+        The rename is atomic, so anything reading the collection never sees a partially loaded export
+        @return: None
+        """
+        log.info('Swapping %s in for %s', self.staging_collection_name, self.collection_name)
+        self.get_collection().rename(self.collection_name, dropTarget=True)
+        self._swapped = True
+
+    def resume(self, reader):
+        """
+        If a previous run of this import failed part way through, move the reader
+        past the records that were written - see MongoTarget.checkpoint()
+        @param reader: ExportFileReader
+        @return: None
+        """
+        checkpoint = self.get_checkpoint_target().get_checkpoint(reader.start)
+
+        if checkpoint:
+            log.info('Resuming %s from offset %s: %s batches written, last irn %s', self.input().file_name, checkpoint['offset'], checkpoint['batches'], checkpoint['irn'])
+            reader.seek(checkpoint['offset'])
+
+    def import_data(self, records, mode, reader=None):
+        """
+        Write records to mongo
+        @param records: iterable of processed records
+        @param mode: WRITE_MODE_INSERT - insert all records
+                     WRITE_MODE_UPDATE - upsert all records
+                     WRITE_MODE_ROUTE - look up which records exist per batch, inserting new and replacing
+                                        existing records - unless their content hash is unchanged
+                     WRITE_MODE_BULK_LOAD - insert all records, with indexes built once the records are loaded
+                     WRITE_MODE_DIFF - look up the existing records per batch, and only update the fields that have changed
+        @param reader: ExportFileReader the records are parsed from - if set, progress is checkpointed
+        @return: Counter of records written
+        """
+        if mode == WRITE_MODE_INSERT:
+            return self.batch_insert(records, reader)
+        elif mode == WRITE_MODE_UPDATE:
+            return self.bulk_update(records, reader)
+        elif mode == WRITE_MODE_ROUTE:
+            return self.write(records, self.route_batch, self.batch_size, reader)
+        elif mode == WRITE_MODE_BULK_LOAD:
+            return self.write(records, self.insert_batch, self.batch_size, reader, write_duplicates=self.update_batch)
+        elif mode == WRITE_MODE_DIFF:
+            return self.write(records, self.diff_batch, self.batch_size, reader)
+        else:
+            raise ValueError('Unknown write mode %s' % mode)
+
+    def log_write_counts(self, counts):
+        """
+        Log the number of records inserted / replaced / skipped as unchanged for the export file
+        @param counts: Counter of records written
+        @return: None
+        """
+        written = counts['inserted'] + counts['replaced'] + counts['updated']
+        log.info('%s: %s records inserted, %s replaced, %s updated (%.1f%% inserts)', self.input().file_name, counts['inserted'], counts['replaced'], counts['updated'], 100.0 * counts['inserted'] / written if written else 0)
+        log.info('%s: %s records written, %s unchanged records skipped, %s duplicate records', self.module, written, counts['skipped'], counts['duplicates'])
+
+        errors = dict((k, v) for k, v in counts.iteritems() if k.startswith('error_') and v)
+
+        if errors:
+            log.error('%s: write errors %s', self.input().file_name, ', '.join('%s=%s' % (k[6:], v) for k, v in sorted(errors.items())))
+
+        rejected = dict((k[9:], v) for k, v in counts.iteritems() if k.startswith('rejected_') and v)
+
+        if rejected:
+            log.info('%s: rejected records %s', self.module, ', '.join('%s=%s' % (k, v) for k, v in sorted(rejected.items())))
+
+    def add_rejected_counts(self, counts):
+        """
+        Add the number of records rejected by each validation rule in this process to the write counts,
+        as rejected_<rule name> - so they're totalled with the write counts from shard and chunk processes
+        @param counts: Counter of records written
+        @return: counts
+        """
+        for name, count in self.validator.counts.iteritems():
+            counts['rejected_%s' % name] += count
+
+        return counts
+
+    def import_sharded(self, mode):
+        """
+        Split the export file into byte ranges at record boundaries, and parse and write
+        each range in a separate process
+        @param mode: write mode - see import_data()
+        @return: Counter of records written
+        """
+        # Compressed files cannot be split - so are decompressed first
+        with self.input().uncompressed_path() as path:
+            # If the export file has been indexed, use it for the split points - otherwise scan the file
+            index = ExportFileIndex(self.input().path)
+
+            if index.is_current():
+                ranges = index.get_ranges(self.shards, os.path.getsize(path))
+            else:
+                ranges = get_export_file_ranges(path, self.shards)
+
+            log.info('Parsing %s in %s shards', self.input().file_name, len(ranges))
+
+            pool = multiprocessing.Pool(processes=len(ranges))
+
+            try:
+                results = pool.map(_import_shard, [(self.__class__, self.param_kwargs, path, start, end, mode) for start, end in ranges])
+            finally:
+                pool.close()
+                pool.join()
+
+            shard_irns, shard_counts = zip(*results)
+            self.resolve_shard_duplicates([(path, start, end) for start, end in ranges], shard_irns)
+            return sum(shard_counts, Counter())
+
+    def import_shard(self, path, start, end, mode):
+        """
+        Parse and write one byte range of the export file
+        Called in a worker process by import_sharded()
+        @return: tuple of numpy array of IRNs written, and Counter of records written
+        """
+        irns = []
+
+        # Mongo clients cannot be shared across processes, so get a new collection reference
+        self.set_write_profile(mode)
+        self.collection = self.get_collection()
+
+        def _records(ke_data):
+            for record in self.iterate_data(ke_data):
+                irns.append(record['_id'])
+                yield record
+
+        with ExportFileReader(open(path, 'rb'), start, end) as reader:
+            self.resume(reader)
+            ke_data = KEParser(reader, file_path=path, schema_file=self.keemu_schema_file, flatten_mode=self.flatten_mode)
+            counts = self.import_data(_records(ke_data), mode, reader)
+
+        return np.array(irns, dtype=np.int64), self.add_rejected_counts(counts)
+
+    def resolve_shard_duplicates(self, shards, shard_irns):
+        """
+        KE exports do duplicate some records, and shards are written concurrently - so if an
+        IRN is duplicated across shards, an earlier version could have been written last
+        Rewrite these records from the last shard they appear in, so the last record in the file wins
+        @param shards: list of shard (path, start, end) - in file order
+        @param shard_irns: list of IRN arrays written by each shard
+        @return: None
+        """
+        duplicates = get_shard_duplicates(shard_irns)
+
+        log.info('%s IRNs duplicated across shards', sum(len(irns) for irns in duplicates.values()))
 
+        for shard, shard_duplicate_irns in sorted(duplicates.items()):
+            path, start, end = shards[shard]
+            # Keyed by IRN, so if it's duplicated within the shard, the last one wins
+            records = {}
+            with ExportFileReader(open(path, 'rb'), start, end) as f:
+                ke_data = KEParser(f, file_path=path, schema_file=self.keemu_schema_file, flatten_mode=self.flatten_mode)
+                for record in self.iterate_data(ke_data):
+                    if record['_id'] in shard_duplicate_irns:
+                        records[record['_id']] = record
+
+            self.bulk_update(records.values())
+
+    def get_checkpoint_target(self):
+        """
+        Target import progress is checkpointed to - this task's marker, unless importing a chunk
+        @return: MongoTarget
+        """
+        return self._checkpoint_target or self.output()
+
+    def get_chunk_tasks(self, mode=WRITE_MODE_UPDATE):
+        """
+        @param mode: write mode for the chunks
+        @return: list of MongoChunkTask
+        """
+        return [MongoChunkTask(module=self.module, date=self.date, chunk=chunk, chunks=self.chunks, write_mode=mode, unprocessed=self.unprocessed, flatten_mode=self.flatten_mode, writer_threads=self.writer_threads, write_profile=self.write_profile, staging=self.staging) for chunk in range(self.chunks)]
+
+    def run_chunked(self):
+        """
+        Split the export file into chunk files, and import each chunk in a separate MongoChunkTask
+        The chunk tasks are yielded as dynamic dependencies, so luigi can schedule them in parallel - and
+        if one fails, only that chunk is re-imported when this task is re-run
+        Once all chunks are complete, this task is marked complete
+        luigi runs this again from the start once the chunk tasks are complete - so anything done
+        before they're yielded only happens while there are chunks to import
+        @return: generator of chunk tasks
+        """
+        chunk_tasks = self.get_chunk_tasks()
+
+        # The write mode is resolved before any chunks are imported - once they start, the collection won't be empty
+        if not all(task.complete() for task in chunk_tasks):
+            self.check_staging()
+            mode = self.resolve_write_mode()
+
+            if mode == WRITE_MODE_BULK_LOAD:
+                log.info('Bulk loading %s: dropping indexes', self.write_collection_name)
+                self.get_collection().drop_indexes()
+
+            log.info('Importing %s in %s chunks (%s)', self.input().file_name, self.chunks, mode)
+            yield self.get_chunk_tasks(mode)
+
+        output = self.output()
+        counts = Counter()
+        shards = []
+        shard_irns = []
+
+        started = []
+
+        for task in chunk_tasks:
+            marker = output.marker_collection.find_one({'update_id': task.task_id}) or {}
+            counts.update(marker.get('counts', {}))
+            if marker.get('started'):
+                started.append(marker['started'])
+            shards.append((task.input()[task.chunk].path, 0, None))
+            shard_irns.append(np.load(get_chunk_irns_path(shards[-1][0])))
+
+        self.log_write_counts(counts)
+        self.resolve_shard_duplicates(shards, shard_irns)
+
+        if self.staging:
+            self.ensure_indexes()
+            self.swap_staging_collection()
+
+        # The import time runs from the first chunk started
+        self.started = min(started) if started else None
         self.mark_complete()
+        chunk_tasks[0].requires().remove()
+
+    def import_chunk(self, path, mode, output):
+        """
+        Import a chunk file split from the export file - see MongoChunkTask
+        @param path: chunk file path
+        @param mode: write mode - see import_data()
+        @param output: target to checkpoint progress to
+        @return: tuple of numpy array of IRNs written, and Counter of records written
+        """
+        self.check_staging()
+        self._checkpoint_target = output
+        return self.import_shard(path, 0, None, mode)
+
+    def import_irns(self, irns):
+        """
+        Re-import individual records from the export file, using the export file index
+        @param irns: list of irns
+        @return: Counter of records written
+        """
+        index = ExportFileIndex.get(self.input().path)
+        records = index.read_records(irns)
+        log.info('Re-importing %s records from %s', len(records), self.input().file_name)
+
+        # Before getting the collection, which is given the profile's write concern
+        self.set_write_profile(WRITE_MODE_UPDATE)
+        self.collection = self.get_collection()
+        ke_data = KEParser(StringIO(''.join(records)), file_path=self.input().path, schema_file=self.keemu_schema_file, flatten_mode=self.flatten_mode)
+        return self.bulk_update(self.iterate_data(ke_data))
 
     def mark_complete(self):
 
         # Move the file to the archive directory (if specified)
         try:
             archive_dir = config.get('keemu', 'archive_dir')
+            # Move the index files with it
+            for sidecar_path in ExportFileIndex(self.input().path).sidecar_paths:
+                if os.path.exists(sidecar_path):
+                    os.rename(sidecar_path, os.path.join(archive_dir, os.path.basename(sidecar_path)))
             self.input().move(os.path.join(archive_dir, self.input().file_name))
         except NoOptionError:
             # Allow archive dir to be none
             pass
 
-        # And mark the object as complete
-        self.output().touch()
+        # And mark the object as complete - with the import time, if this task has run the import
+        output = self.output()
+
+        if self.started:
+            output.touch(started=self.started, seconds=(datetime.datetime.now() - self.started).total_seconds())
+        else:
+            output.touch()
+
+        output.clear_checkpoints()
 
-    def bulk_update(self, ke_data):
+    def bulk_update(self, records, reader=None):
+        # Bulk ops can have out of memory errors (I'm getting for ~400,000+ bulk ops)
+        # So execute the bulk op in stages, when bulk_op_size is reached
+        return self.write(records, self.update_batch, self.bulk_op_size, reader)
 
-        bulk = self.collection.initialize_unordered_bulk_op()
+    def batch_insert(self, records, reader=None):
+        # Records duplicating an irn from an earlier batch are upserted, so the insert doesn't fail
+        return self.write(records, self.insert_batch, self.batch_size, reader, write_duplicates=self.update_batch)
 
-        count = 0
+    def write(self, records, write_batch, batch_size, reader=None, write_duplicates=None):
+        """
+        Write records in batches of up to batch_size records or batch_bytes
+        Batches are written by writer threads, each with their
+        own mongo connection, so parsing the file is not blocked by waiting on mongo
+        @param records: iterable of processed records
+        @param write_batch: function(collection, batch) to write each batch, returning a dict of counts
+        @param batch_size: number of records per batch
+        @param reader: ExportFileReader the records are parsed from - if set, a checkpoint
+                       is recorded after each batch, so the import can be resumed
+                       Not with an unacknowledged write concern (w=0) - we wouldn't know the batch was written
+        @param write_duplicates: function(collection, batch) to write records duplicating
+                                 an irn from an earlier batch - if set, duplicates are removed
+                                 from the batches passed to write_batch
+        @return: Counter of records written
+        """
+        checkpoint = None
+
+        if reader and self.write_concern.get('w') == 0:
+            log.warning('%s: unacknowledged write concern - import progress will not be checkpointed', self.module)
+        elif reader:
+            output = self.get_checkpoint_target()
+            checkpoint = lambda position, irn: output.checkpoint(reader.start, position, irn)
+
+        with BatchWriter(write_batch, self.get_collection, batch_size, batch_bytes=self.batch_bytes, writers=self.writer_threads, checkpoint=checkpoint, position=reader.tell() if reader else 0, write_duplicates=write_duplicates) as writer:
+            for record in records:
+                # Once KEParser has yielded a record, the reader is positioned at the end of it
+                writer.add(record, reader.tell() if reader else None)
 
-        for record in self.iterate_data(ke_data):
+        return writer.counts
 
+    def update_batch(self, collection, batch):
+
+        bulk = self.initialize_bulk_op(collection)
+
+        for record in batch:
             # Find and replace doc - inserting if it doesn't exist
             bulk.find({'_id': record['_id']}).upsert().replace_one(record)
-            count += 1
 
-            # Bulk ops can have out of memory errors (I'm getting for ~400,000+ bulk ops)
-            # So execute the bulk op in stages, when bulk_op_size is reached
-            if count % self.bulk_op_size == 0:
-                log.info('Executing bulk op')
-                bulk.execute()
-                bulk = self.collection.initialize_unordered_bulk_op()
+        bulk.execute()
+
+        return {'replaced': len(batch)}
+
+    def insert_batch(self, collection, batch):
+        """
+        Insert the batch with an unordered bulk op, so one failed insert doesn't stop the rest
+        This is always unordered, whatever the write profile, so the failed records can be retried
+        Only the records that failed are retried: duplicates are upserted, so the last record in
+        the export wins, and records that can never be written (too large, invalid keys) are logged and skipped
+        Failures are counted by error - error_duplicate_key etc.,
+        """
+        bulk = collection.initialize_unordered_bulk_op()
+
+        for record in batch:
+            bulk.insert(record)
+
+        counts = Counter(inserted=len(batch))
 
         try:
             bulk.execute()
-        except InvalidOperation:
-            # If we do not have any records to execute, ignore error
-            # They have been executed in ln124
-            pass
+        except BulkWriteError as e:
+            if e.details['writeConcernErrors']:
+                raise
+
+            duplicates = []
+
+            # Errors are in the order of the batch, so duplicates within the batch are replaced in order
+            for error in sorted(e.details['writeErrors'], key=lambda error: error['index']):
 
-    def batch_insert(self, ke_data):
+                # Unexpected error - raise it
+                if error['code'] not in WRITE_ERRORS:
+                    raise
 
-        def _insert(batch):
+                record = batch[error['index']]
+                counts['inserted'] -= 1
+                counts['error_%s' % WRITE_ERRORS[error['code']]] += 1
 
+                if WRITE_ERRORS[error['code']] == WRITE_ERROR_DUPLICATE_KEY:
+                    duplicates.append(record)
+                else:
+                    log.error('Skipping record %s: %s', record['_id'], error['errmsg'])
+
+            if duplicates:
+                log.error('%s duplicate key errors - replacing records', len(duplicates))
+                counts.update(self.update_batch(collection, duplicates))
+
+        except InvalidDocument:
+            # pymongo validates records as it sends them, so some of the batch may have been written
+            # Find the invalid records by inserting the rest one at a time
+            log.error('Invalid record in batch - inserting records individually')
+            records, written = self.drop_written_records(collection, batch)
+            counts = self.insert_records(collection, records)
+            counts['inserted'] += written
+
+        return counts
+
+    def drop_written_records(self, collection, records):
+        """
+        Remove records already written - stored with the same content hash - so they aren't
+        written again, and counted as duplicates
+        @param collection: collection
+        @param records: list of records
+        @return: tuple of list of records still to write, and number of records dropped
+        """
+        stored = dict((r['_id'], r.get(HASH_FIELD)) for r in collection.find({'_id': {'$in': [record['_id'] for record in records]}}, {HASH_FIELD: 1}))
+        unwritten = [record for record in records if record['_id'] not in stored or stored[record['_id']] != record.get(HASH_FIELD)]
+        return unwritten, len(records) - len(unwritten)
+
+    def insert_records(self, collection, records):
+        """
+        Insert records one at a time, skipping any that are invalid
+        """
+        counts = Counter()
+
+        for record in records:
             try:
-                self.collection.insert(batch)
+                collection.insert(record)
             except DuplicateKeyError:
-                # Duplicate key error - KE export does duplicate some records
-                # So switch to bulk upsert for this operation
+                counts['error_%s' % WRITE_ERROR_DUPLICATE_KEY] += 1
+                counts.update(self.update_batch(collection, [record]))
+            except DocumentTooLarge as e:
+                log.error('Skipping record %s: %s', record['_id'], e)
+                counts['error_%s' % WRITE_ERROR_TOO_LARGE] += 1
+            except InvalidDocument as e:
+                log.error('Skipping record %s: %s', record['_id'], e)
+                counts['error_%s' % WRITE_ERROR_INVALID_KEY] += 1
+            else:
+                counts['inserted'] += 1
 
-                log.error('Duplicate key error - switching to upsert')
+        return counts
 
-                bulk = self.collection.initialize_unordered_bulk_op()
-                for batch_record in batch:
-                    bulk.find({'_id': batch_record['_id']}).upsert().replace_one(batch_record)
+    def route_batch(self, collection, batch):
+        """
+        Look up which records in the batch already exist, and their content hash, with a single $in query
+        And insert the new records, only replacing the existing ones that have changed
+        """
+        existing_hashes = dict((r['_id'], r.get(HASH_FIELD)) for r in collection.find({'_id': {'$in': [record['_id'] for record in batch]}}, {HASH_FIELD: 1}))
+
+        new_records = []
+        existing_records = []
+        skipped_records = []
+        counts = Counter()
+
+        for record in batch:
+            if record['_id'] not in existing_hashes:
+                new_records.append(record)
+            elif record.get(HASH_FIELD) and record[HASH_FIELD] == existing_hashes[record['_id']]:
+                # Record hasn't changed since it was last written - skip it
+                skipped_records.append(record)
+            else:
+                existing_records.append(record)
 
-                bulk.execute()
+        if new_records:
+            counts.update(self.insert_batch(collection, new_records))
 
-        batch = []
+        if existing_records:
+            counts.update(self.update_batch(collection, existing_records))
 
-        for record in self.iterate_data(ke_data):
+        if skipped_records:
+            counts['skipped'] += len(skipped_records)
+            self.touch_records(collection, skipped_records)
 
-            if self.batch_size:
-                batch.append(record)
+        return counts
 
-                # If the batch length equals the batch size, commit and clear the batch
-                if len(batch) % self.batch_size == 0:
-                    log.info('Submitting batch')
-                    _insert(batch)
-                    batch = []
+    def touch_records(self, collection, records):
+        """
+        Records skipped as unchanged keep the exportFileDate they were last written with - so
+        set it to the date of this export, with a single update per date
+        MongoDeleteTask relies on exportFileDate being the date the record was last exported, so
+        a record deleted and then re-exported unchanged isn't removed by the earlier delete
+        @param collection: collection
+        @param records: records skipped as unchanged
+        @return: None
+        """
+        irns = defaultdict(list)
+
+        for record in records:
+            # Unprocessed records don't have an export date
+            if record.get('exportFileDate'):
+                irns[record['exportFileDate']].append(record['_id'])
+
+        for date, date_irns in irns.iteritems():
+            # Never move the date backwards, if a later export has already been imported
+            collection.update({'_id': {'$in': date_irns}, 'exportFileDate': {'$lt': date}}, {'$set': {'exportFileDate': date}}, multi=True)
+
+    def diff_batch(self, collection, batch):
+        """
+        Fetch the existing records in the batch with a single $in query, and for each changed record
+        only $set / $unset the fields that differ - so unchanged fields and their indexes aren't rewritten
+        New records are upserted in full
+        """
+        # KE exports do duplicate some records - the bulk op is unordered, so only keep the last version of each
+        batch = OrderedDict((record['_id'], record) for record in batch).values()
+        existing_records = dict((r['_id'], r) for r in collection.find({'_id': {'$in': [record['_id'] for record in batch]}}))
+
+        bulk = self.initialize_bulk_op(collection)
+        counts = Counter()
+        skipped_records = []
 
+        for record in batch:
+            existing = existing_records.get(record['_id'])
+
+            if existing is None:
+                bulk.find({'_id': record['_id']}).upsert().replace_one(record)
+                counts['inserted'] += 1
+                continue
+
+            # Record hasn't changed since it was last written - skip it, just updating its export date
+            if record.get(HASH_FIELD) and record[HASH_FIELD] == existing.get(HASH_FIELD):
+                skipped_records.append(record)
+                continue
+
+            update = get_record_diff(existing, record)
+
+            if update:
+                bulk.find({'_id': record['_id']}).update_one(update)
+                counts['updated'] += 1
             else:
-                self.collection.insert(record)
+                counts['skipped'] += 1
+
+        if counts['inserted'] or counts['updated']:
+            bulk.execute()
+
+        if skipped_records:
+            counts['skipped'] += len(skipped_records)
+            self.touch_records(collection, skipped_records)
 
-        # Add any records remaining in the batch
-        if batch:
-            _insert(batch)
+        return counts
 
     def iterate_data(self, ke_data):
         """
@@ -181,19 +868,40 @@ class MongoTask(luigi.Task):
             if status:
                 log.info(status)
 
-            # Use the IRN as _id
-            record['_id'] = record['irn']
-
-            try:
-                # Do not process if unprocessed flag is set
-                if not self.unprocessed:
-                    record = self.process_record(record)
+            record = self.prepare_record(record)
 
-            except InvalidRecordException:
-                continue
-            else:
+            if record is not None:
                 yield record
 
+    def prepare_record(self, record):
+        """
+        Process a record parsed from the export file, and add its content hash
+        @param record: record
+        @return: record, or None if the record should be skipped
+        """
+        # Use the IRN as _id
+        record['_id'] = record['irn']
+
+        try:
+            # Do not process if unprocessed flag is set
+            if not self.unprocessed:
+                record = self.field_table.apply(record)
+                rule = self.validator.validate(record)
+
+                if rule:
+                    log.log(rule.level, 'Skipping record %s: %s %s=%s', record['irn'], rule.name, rule.field, record.get(rule.field))
+                    raise InvalidRecordException(rule.name)
+
+                record = self.process_record(record)
+
+        except InvalidRecordException:
+            return None
+
+        # Add a hash of the record contents, so we can skip unchanged records on update
+        record[HASH_FIELD] = get_record_hash(record, HASH_EXCLUDED_FIELDS)
+
+        return record
+
     def process_record(self, record):
 
         # Keep the IRN but cast as string, so we can use it in $concat
@@ -211,14 +919,78 @@ class MongoTask(luigi.Task):
         """This update id will be a unique identifier for this insert on this collection."""
         return self.task_id
 
+    def ensure_indexes(self):
+        """
+        Build the indexes declared in self.indexes, if they don't already exist
+        @return: seconds taken
+        """
+        collection = self.get_collection()
+        t = time.time()
+
+        for index in self.indexes:
+            log.info("Adding %s index %s", self.write_collection_name, index)
+            collection.ensure_index(index)
+
+        return time.time() - t
+
     def on_success(self):
         """
         On completion, add indexes
         @return: None
         """
+        self.ensure_indexes()
 
-        self.collection = self.get_collection()
 
-        log.info("Adding exportFileDate index")
+class MongoChunkTask(luigi.Task):
+    """
+    Import one chunk file of a module's export file - see MongoTask.run_chunked()
+    Each chunk has its own marker, so if a chunk fails, the completed chunks aren't re-imported
+    """
+
+    module = luigi.Parameter()
+    date = luigi.IntParameter()
+    chunk = luigi.IntParameter()
+    chunks = luigi.IntParameter()
+    # Passed through to the module's MongoTask
+    write_mode = WriteModeParameter(default=WRITE_MODE_UPDATE, significant=False)
+    unprocessed = luigi.BooleanParameter(default=False, significant=False)
+    flatten_mode = FlattenModeParameter(default=FLATTEN_ALL, significant=False)
+    writer_threads = luigi.IntParameter(default=1, significant=False)
+    write_profile = luigi.Parameter(default=None, significant=False)
+    # Only allowed for the full export date - see MongoTask.check_staging()
+    staging = luigi.BooleanParameter(default=False, significant=False)
+
+    database = config.get('mongo', 'database')
+
+    @property
+    def resources(self):
+        return mongo_get_writer_resources()
+
+    @property
+    def task_cls(self):
+        for cls in MongoTask.__subclasses__():
+            if cls.module == self.module:
+                return cls
+        raise ValueError('No mongo task for module %s' % self.module)
+
+    def get_task(self):
+        return self.task_cls(date=self.date, unprocessed=self.unprocessed, flatten_mode=self.flatten_mode, writer_threads=self.writer_threads, write_profile=self.write_profile, staging=self.staging)
+
+    def requires(self):
+        return KESplitTask(module=self.module, file_extension=self.task_cls.file_extension, date=self.date, chunks=self.chunks)
+
+    def output(self):
+        return MongoTarget(database=self.database, update_id=self.task_id)
+
+    def run(self):
+        started = datetime.datetime.now()
+        path = self.input()[self.chunk].path
+        output = self.output()
+
+        irns, counts = self.get_task().import_chunk(path, self.write_mode, output)
+
+        # Saved for resolving IRNs duplicated across chunks, once all chunks are imported
+        np.save(get_chunk_irns_path(path), irns)
 
-        self.collection.ensure_index('exportFileDate')
+        output.touch(started=started, seconds=(datetime.datetime.now() - started).total_seconds(), counts=dict(counts))
+        output.clear_checkpoints()
@@ -11,11 +11,11 @@ Copyright (c) 2013 'bens3'. All rights reserved.
 
 import time
 import luigi
-from uuid import UUID
-from ke2mongo.lib.cites import get_cites_species
-from ke2mongo.tasks.mongo import MongoTask, InvalidRecordException
+import logging
+from ke2mongo.lib.cites import get_cites_matcher
+from ke2mongo.lib.validation import Exclude, GUID, Required, Length
+from ke2mongo.tasks.mongo import MongoTask
 from ke2mongo.tasks import DATE_FORMAT
-from ke2mongo.log import log
 from datetime import datetime
 
 class MongoCatalogueTask(MongoTask):
@@ -49,54 +49,52 @@ class MongoCatalogueTask(MongoTask):
         'Transient Lot'
     ]
 
-    cites_species = get_cites_species()
-
-    def process_record(self, data):
-
+    validation_rules = [
         # Only import if it's one of the record types we want
-        record_type = data.get('ColRecordType', 'Missing')
-
-        if record_type in self.excluded_types:
-            log.debug('Skipping record %s: Excluded type %s', data['irn'], record_type)
-            raise InvalidRecordException
-
+        Exclude('ColRecordType', excluded_types, default='Missing', name='excluded_type'),
         # Make sure the UUID is valid
+        GUID('AdmGUIDPreferredValue', name='invalid_guid'),
+        # If we don't have collection department, skip it
+        Required('ColDepartment', name='missing_department'),
+        # Some records have an invalid AdmDateInserted=20-09-27
+        # As we need this for the stats, we need to skip them - just checking against date length as it's much quicker
+        Length('AdmDateInserted', len(DATE_FORMAT), name='invalid_date_inserted', level=logging.ERROR),
+    ]
 
-        guid = data.get('AdmGUIDPreferredValue', None)
-
-        if guid:
+    # For now, the mongo aggregator cannot handle int / bool in $concat
+    # So properties that are used in dynamicProperties need to be cast as strings
+    field_converters = dict.fromkeys(['DnaTotalVolume', 'FeaCultivated', 'MinMetRecoveryWeight', 'MinMetWeightAsRegistered'], 'string')
 
-            try:
-                UUID(guid, version=4)
-            except ValueError:
-                # print 'Skipping: not a valid UUID'
-                # Value error - not a valid hex code for a UUID.
-                # continue
-                print 'ERROR: ', guid
-                raise InvalidRecordException
+    indexes = MongoTask.indexes + [
+        'ColRecordType',
+        # Only include active records - not Stubs etc.,
+        'SecRecordStatus',
+        # Add index on RegRegistrationParentRef - select records with the same parent
+        'RegRegistrationParentRef',
+        # Need to filter on web publishable
+        'AdmPublishWebNoPasswordFlag',
+        # Exclude records if they do not have a GUID
+        'AdmGUIDPreferredValue',
+        # Add embargo date index
+        'RealEmbargoDate',
+        # Re-flagging CITES records - see CitesTask
+        'DarScientificName'
+    ]
 
-        # If we don't have collection department, skip it
-        if not data.get('ColDepartment', None):
-            raise InvalidRecordException
+    # Loaded the first time a name is matched
+    cites_matcher = get_cites_matcher()
 
-        date_inserted = data.get('AdmDateInserted', None)
+    # Embargo date string => timestamp - see date_to_timestamp()
+    _timestamps = {}
 
-        # Some records have an invalid AdmDateInserted=20-09-27
-        # As we need this for the stats, we need to skip them - just checking against date length as it's much quicker
-        if not date_inserted or len(DATE_FORMAT) != len(date_inserted):
-            log.error('Skipping record %s: invalid AdmDateInserted %s', data['irn'], date_inserted)
-            raise InvalidRecordException
+    def process_record(self, data):
 
-        # For now, the mongo aggregator cannot handle int / bool in $concat
-        # So properties that are used in dynamicProperties need to be cast as strings
-        for i in ['DnaTotalVolume', 'FeaCultivated', 'MinMetRecoveryWeight', 'MinMetWeightAsRegistered']:
-            if i in data:
-                data[i] = str(data[i])
+        # Records are validated against validation_rules before they get here
 
         # If record is a CITES species, mark cites = True
         scientific_name = data.get('DarScientificName', None)
 
-        if scientific_name and scientific_name in self.cites_species:
+        if scientific_name and self.cites_matcher.match(scientific_name):
             data['cites'] = True
 
         # For the embargo date, we're going to use the latest of NhmSecEmbargoDate and NhmSecEmbargoExtensionDate
@@ -106,7 +104,7 @@ class MongoCatalogueTask(MongoTask):
 
         for f in ['NhmSecEmbargoDate', 'NhmSecEmbargoExtensionDate']:
             if data.get(f):
-                ts =self.date_to_timestamp(data.get(f))
+                ts = self.date_to_timestamp(data.get(f))
             else:
                 ts = 0
             embargo_list.append(ts)
@@ -115,34 +113,18 @@ class MongoCatalogueTask(MongoTask):
         data['RealEmbargoDate'] = max(embargo_list)
         return super(MongoCatalogueTask, self).process_record(data)
 
-    def on_success(self):
-        """
-        On completion, add indexes
-        @return: None
-        """
-        self.collection = self.get_collection()
-        log.info("Adding ecatalogue indexes")
-        self.collection.ensure_index('ColRecordType')
-        # Only include active records - not Stubs etc.,
-        self.collection.ensure_index('SecRecordStatus')
-        # Add index on RegRegistrationParentRef - select records with the same parent
-        self.collection.ensure_index('RegRegistrationParentRef')
-        # Need to filter on web publishable
-        self.collection.ensure_index('AdmPublishWebNoPasswordFlag')
-        # Exclude records if they do not have a GUID
-        self.collection.ensure_index('AdmGUIDPreferredValue')
-        # Add embargo date index
-        self.collection.ensure_index('RealEmbargoDate')
-        super(MongoCatalogueTask, self).on_success()
-
-    @staticmethod
-    def date_to_timestamp(data_str):
+    @classmethod
+    def date_to_timestamp(cls, data_str):
         """
         Convert date string to timestamp
+        There are relatively few distinct embargo dates, so timestamps are cached
         :return: timestamp
         """
-
-        return time.mktime(datetime.strptime(data_str, "%Y-%m-%d").timetuple())
+        try:
+            return cls._timestamps[data_str]
+        except KeyError:
+            ts = cls._timestamps[data_str] = time.mktime(datetime.strptime(data_str, "%Y-%m-%d").timetuple())
+            return ts
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Import all outstanding export files for a module in one pass
+
+python tasks/mongo_catch_up.py --local-scheduler --module ecatalogue
+
+The export files are read newest first, and only the latest version of each record is written -
+so if several weeks of exports are outstanding, each record is only written once. Deletes from
+the eaudit export for each date are applied in order, and each date's update marker is written.
+Once every module has been imported for a date, its MongoDeleteTask is run, so its marker is written too.
+
+"""
+
+import luigi
+from collections import Counter
+from keparser import KEParser
+from ke2mongo.log import log
+from ke2mongo.lib.file import get_export_file_dates
+from ke2mongo.lib.writer import IRNSet
+from ke2mongo.tasks.mongo import WRITE_MODE_ROUTE, WRITE_MODE_INSERT
+from ke2mongo.tasks.mongo_delete import MongoDeleteTask
+from ke2mongo.tasks.mongo_import import MongoImportTask
+
+
+class MongoCatchUpTask(luigi.Task):
+
+    module = luigi.Parameter()
+
+    # Number of IRNs per delete query
+    delete_batch_size = 1000
+
+    @property
+    def task_cls(self):
+        return dict((cls.module, cls) for cls in MongoImportTask.tasks)[self.module]
+
+    def get_outstanding_tasks(self):
+        """
+        Get the import tasks for all export dates that haven't yet been imported
+        @return: list of tasks, newest first
+        """
+        tasks = [self.task_cls(date=date) for date in get_export_file_dates()]
+        return sorted([task for task in tasks if not task.complete()], key=lambda task: task.date, reverse=True)
+
+    def complete(self):
+        return not self.get_outstanding_tasks()
+
+    def get_deleted_irns(self, date):
+        """
+        Get the IRNs of this module's records deleted in the eaudit export for a date
+        @param date: export date
+        @return: list of irns
+        """
+        try:
+            target = MongoDeleteTask(date=date).input()
+        except IOError:
+            # No eaudit export for this date
+            return []
+
+        ke_data = KEParser(target.open('r'), file_path=target.path, schema_file=MongoDeleteTask.keemu_schema_file)
+
+        return [int(record['AudKey']) for record in ke_data if record.get('AudTable') == self.module]
+
+    def iterate_data(self, tasks, deleted_irns, counts):
+        """
+        Iterate through the export files newest first, yielding the latest version of each record
+        @param tasks: import tasks, newest first
+        @param deleted_irns: list, to which the IRNs of records deleted after their latest export are added
+        @param counts: Counter of records superseded by a later export or delete
+        @return: generator of processed records
+        """
+        # IRNs of records that have a later export or delete
+        superseded = IRNSet()
+
+        for task in tasks:
+
+            # Deletes on a date are applied after that date's import - so they supersede its records
+            for irn in self.get_deleted_irns(task.date):
+                if irn not in superseded:
+                    superseded.add(irn)
+                    deleted_irns.append(irn)
+
+            log.info('Importing %s', task.input().file_name)
+
+            irns = []
+
+            with task.input().open_reader() as reader:
+                ke_data = KEParser(reader, file_path=task.input().path, schema_file=task.keemu_schema_file, flatten_mode=task.flatten_mode)
+
+                for record in ke_data:
+
+                    status = ke_data.get_status()
+
+                    if status:
+                        log.info(status)
+
+                    # Skip records that have a later version - before processing them
+                    if int(record['irn']) in superseded:
+                        counts['superseded'] += 1
+                        continue
+
+                    record = task.prepare_record(record)
+
+                    if record is not None:
+                        irns.append(record['_id'])
+                        yield record
+
+            # Only mark as superseded once the whole file has been read - if a record is
+            # duplicated within the file, each version is written in order, so the last one wins
+            for irn in irns:
+                superseded.add(irn)
+
+    def run(self):
+
+        tasks = self.get_outstanding_tasks()
+
+        log.info('Catching up %s: %s', self.module, ', '.join(str(task.date) for task in tasks))
+
+        # Records are written through the newest task
+        newest = tasks[0]
+        mode = WRITE_MODE_ROUTE if newest.get_collection().find_one() else WRITE_MODE_INSERT
+        newest.set_write_profile(mode)
+        newest.collection = newest.get_collection()
+
+        deleted_irns = []
+        counts = Counter()
+        counts.update(newest.import_data(self.iterate_data(tasks, deleted_irns, counts), mode))
+
+        # None of the deleted records have been written, so the order of writes and deletes doesn't matter
+        for i in range(0, len(deleted_irns), self.delete_batch_size):
+            newest.collection.remove({'_id': {'$in': deleted_irns[i:i + self.delete_batch_size]}})
+
+        counts['deleted'] = len(deleted_irns)
+
+        # Records are processed by the task for their date - so total the rejections from each
+        for task in tasks:
+            task.add_rejected_counts(counts)
+
+        newest.log_write_counts(counts)
+        log.info('%s: %s superseded records skipped, %s records deleted', self.module, counts['superseded'], counts['deleted'])
+
+        # Complete the tasks for every date, oldest first - as if luigi had run them
+        for task in reversed(tasks):
+            task.mark_complete()
+            task.on_success()
+            self.complete_deletes(task.date)
+
+    def complete_deletes(self, date):
+        """
+        Once every module has been imported for a date, run the date's MongoDeleteTask, so its marker is written
+        This module's deletes have already been applied, but the delete query skips records re-imported from
+        later exports - so applying them again is harmless, and the other modules' deletes are applied as usual
+        @param date: export date
+        @return: None
+        """
+        task = MongoDeleteTask(date=date, force=True)
+
+        if task.complete() or not all(cls(date=date).complete() for cls in MongoImportTask.tasks):
+            return
+
+        try:
+            task.input()
+        except IOError:
+            # No eaudit export for this date
+            return
+
+        task.run()
+        task.on_success()
+
+
+if __name__ == "__main__":
+    luigi.run(main_task_cls=MongoCatchUpTask)
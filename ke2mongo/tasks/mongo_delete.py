@@ -69,13 +69,31 @@ class MongoDeleteTask(MongoTask):
 
         self.mark_complete()
 
+    def get_delete_query(self, irn):
+        """
+        Query matching the record to delete - unless it has been re-imported from a later export
+        (after a catch-up import, see MongoCatchUpTask, deletes for earlier dates can run after later imports)
+        exportFileDate is the date the record was last exported - it's updated even if the record
+        was skipped as unchanged (see MongoTask.touch_records()), so a record deleted and then
+        re-exported unchanged is kept
+        @param irn: record irn
+        @return: query dict
+        """
+        return {
+            '_id': irn,
+            '$or': [
+                {'exportFileDate': {'$lte': self.date}},
+                {'exportFileDate': {'$exists': False}}
+            ]
+        }
+
     def delete(self, collection, irn):
         """
         Delete the actual record
         """
 
         # Delete from MongoDB
-        collection.remove({'_id': irn})
+        collection.remove(self.get_delete_query(irn))
 
 if __name__ == "__main__":
     luigi.run(main_task_cls=MongoDeleteTask)
\ No newline at end of file
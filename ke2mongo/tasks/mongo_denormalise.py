@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Embed site and collection event fields in the catalogue records, so the datasets can be built
+from the catalogue collection alone - see DatasetTask.get_collection_source_columns()
+
+python tasks/mongo_denormalise.py --local-scheduler --date 20160519
+
+Run once the modules for a date have been imported. Only catalogue records imported for the date,
+and records referencing sites / collection events imported for the date, are updated.
+
+Catalogue records imported before denormalisation was enabled are updated once, by MongoDenormaliseBackfillTask -
+which MongoDenormaliseTask requires, so it runs before the first denormalisation.
+
+"""
+
+import time
+import luigi
+from ke2mongo import config
+from ke2mongo.log import log
+from ke2mongo.lib.mongo import mongo_client_db
+from ke2mongo.targets.mongo import MongoTarget
+from ke2mongo.tasks.mongo_catalogue import MongoCatalogueTask
+from ke2mongo.tasks.mongo_import import MongoImportTask
+
+# Collections embedded in the catalogue records - (collection, catalogue reference field, fields embedded)
+# Each is embedded as a sub document named after the collection, eg. esites.LatLatitude
+DENORMALISED_JOINS = [
+    ('esites', 'sumSiteRef', ['LatLongitude', 'LatLatitude']),
+    ('ecollectionevents', 'sumCollectionEventRef', ['ColParticipantLocal']),
+]
+
+DENORMALISED_COLLECTIONS = [collection for collection, _, _ in DENORMALISED_JOINS]
+
+
+class MongoDenormaliseBackfillTask(luigi.Task):
+    """
+    Embed the site and collection event fields in every catalogue record
+    Runs once - its marker stops it being run again - so the catalogue records already imported
+    when denormalisation is enabled don't have to be re-imported
+    """
+
+    database = config.get('mongo', 'database')
+
+    # Number of referenced records per batch
+    batch_size = 1000
+
+    def output(self):
+        return MongoTarget(database=self.database, update_id=self.task_id)
+
+    def backfill(self, db, catalogue, collection, ref_field, fields):
+        """
+        Embed every record of a referenced collection in the catalogue records referencing it
+        @param db: mongo database
+        @param catalogue: catalogue collection
+        @param collection: referenced collection name
+        @param ref_field: catalogue field referencing the collection
+        @param fields: fields to embed
+        @return: number of catalogue records modified
+        """
+        modified = 0
+        bulk = catalogue.initialize_unordered_bulk_op()
+        count = 0
+
+        for doc in db[collection].find({}, fields):
+            bulk.find({ref_field: doc['_id']}).update({'$set': {collection: doc}})
+            count += 1
+
+            if count % self.batch_size == 0:
+                modified += bulk.execute().get('nModified', 0)
+                bulk = catalogue.initialize_unordered_bulk_op()
+                log.info('Embedded %s %s records', count, collection)
+
+        if count % self.batch_size:
+            modified += bulk.execute().get('nModified', 0)
+
+        return modified
+
+    def run(self):
+        db = mongo_client_db()
+        catalogue = db[MongoCatalogueTask(date=None).collection_name]
+
+        for collection, ref_field, fields in DENORMALISED_JOINS:
+            catalogue.ensure_index(ref_field)
+            t = time.time()
+            modified = self.backfill(db, catalogue, collection, ref_field, fields)
+            log.info('Backfilled %s in %s catalogue records in %.2f sec', collection, modified, time.time() - t)
+
+        self.output().touch()
+
+
+class MongoDenormaliseTask(luigi.Task):
+
+    date = luigi.IntParameter()
+
+    database = config.get('mongo', 'database')
+
+    # Number of referenced records per batch
+    batch_size = 1000
+
+    def requires(self):
+        return [MongoImportTask(date=self.date), MongoDenormaliseBackfillTask()]
+
+    def output(self):
+        return MongoTarget(database=self.database, update_id=self.task_id)
+
+    def denormalise(self, db, catalogue, collection, ref_field, fields):
+        """
+        Embed the fields of a referenced collection in the catalogue records
+        @param db: mongo database
+        @param catalogue: catalogue collection
+        @param collection: referenced collection name
+        @param ref_field: catalogue field referencing the collection
+        @param fields: fields to embed
+        @return: number of catalogue records modified
+        """
+        # Referenced records changed in this export - every catalogue record referencing them is updated
+        changed = set(r['_id'] for r in db[collection].find({'exportFileDate': self.date}, {'_id': 1}))
+
+        # Records referenced by catalogue records changed in this export - only the changed catalogue records are updated
+        # Grouped with an aggregation cursor rather than distinct(), which fails if the refs exceed the 16MB document limit
+        # - as they can on the full export date, when every catalogue record has changed
+        pipeline = [
+            {'$match': {'exportFileDate': self.date}},
+            {'$group': {'_id': '$%s' % ref_field}}
+        ]
+        irns = changed | set(r['_id'] for r in catalogue.aggregate(pipeline, allowDiskUse=True, cursor={}))
+        irns = sorted(irn for irn in irns if irn)
+
+        modified = 0
+
+        for i in range(0, len(irns), self.batch_size):
+            batch = irns[i:i + self.batch_size]
+            docs = dict((r['_id'], r) for r in db[collection].find({'_id': {'$in': batch}}, fields))
+            bulk = catalogue.initialize_unordered_bulk_op()
+
+            for irn in batch:
+                query = {ref_field: irn}
+
+                if irn not in changed:
+                    query['exportFileDate'] = self.date
+
+                if irn in docs:
+                    bulk.find(query).update({'$set': {collection: docs[irn]}})
+                else:
+                    # Referenced record doesn't exist
+                    bulk.find(query).update({'$unset': {collection: ''}})
+
+            result = bulk.execute()
+            modified += result.get('nModified', 0)
+
+        return modified
+
+    def run(self):
+        db = mongo_client_db()
+        catalogue = db[MongoCatalogueTask(date=None).collection_name]
+
+        for collection, ref_field, fields in DENORMALISED_JOINS:
+            catalogue.ensure_index(ref_field)
+            t = time.time()
+            modified = self.denormalise(db, catalogue, collection, ref_field, fields)
+            log.info('Embedded %s in %s catalogue records in %.2f sec', collection, modified, time.time() - t)
+
+        self.output().touch()
+
+
+if __name__ == "__main__":
+    luigi.run(main_task_cls=MongoDenormaliseTask)
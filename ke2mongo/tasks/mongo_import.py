@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Import all KE EMu modules for a date
+
+Each module's import is independent, so run with multiple luigi workers to import them concurrently:
+
+python tasks/mongo_import.py --local-scheduler --date 20160519 --workers 6
+
+The number of imports writing to mongo at once can be limited with the mongo writers resource, in the resources
+section of the luigi config (client.cfg) - see lib.mongo.mongo_get_writer_resource(). Without a limit set, every worker writes at once
+
+"""
+
+import luigi
+from ke2mongo import config
+from ke2mongo.log import log
+from ke2mongo.targets.mongo import MongoTarget
+from ke2mongo.tasks.mongo_catalogue import MongoCatalogueTask
+from ke2mongo.tasks.mongo_taxonomy import MongoTaxonomyTask
+from ke2mongo.tasks.mongo_multimedia import MongoMultimediaTask
+from ke2mongo.tasks.mongo_collection_index import MongoCollectionIndexTask
+from ke2mongo.tasks.mongo_collection_event import MongoCollectionEventTask
+from ke2mongo.tasks.mongo_site import MongoSiteTask
+
+
+class MongoImportTask(luigi.Task):
+    """
+    Import all modules for a date - and once complete, log how long each module took
+    """
+
+    date = luigi.IntParameter()
+
+    database = config.get('mongo', 'database')
+
+    # List of all module import tasks
+    tasks = [
+        MongoCatalogueTask,
+        MongoTaxonomyTask,
+        MongoMultimediaTask,
+        MongoCollectionIndexTask,
+        MongoCollectionEventTask,
+        MongoSiteTask
+    ]
+
+    def requires(self):
+        return [task(date=self.date) for task in self.tasks]
+
+    def output(self):
+        return MongoTarget(database=self.database, update_id=self.task_id)
+
+    def run(self):
+        output = self.output()
+        timings = []
+
+        for task in self.requires():
+            marker = output.marker_collection.find_one({'update_id': task.task_id}) or {}
+            timings.append((task.module, marker.get('started'), marker.get('seconds')))
+
+        log.info('Import times for %s:', self.date)
+
+        for module, started, seconds in timings:
+            if seconds is None:
+                log.info('\t%s: imported previously', module)
+            else:
+                log.info('\t%s: %.1f sec', module, seconds)
+
+        timed = [(started, seconds) for _, started, seconds in timings if seconds is not None]
+
+        if timed:
+            # Wall time from the first import starting to the last one finishing
+            start = min(started for started, _ in timed)
+            end = max((started - start).total_seconds() + seconds for started, seconds in timed)
+            log.info('Total: %.1f sec wall time, %.1f sec sum of module times', end, sum(seconds for _, seconds in timed))
+
+        output.touch()
+
+
+if __name__ == "__main__":
+    luigi.run(main_task_cls=MongoImportTask)
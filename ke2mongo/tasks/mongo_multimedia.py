@@ -10,6 +10,7 @@ Copyright (c) 2013 'bens3'. All rights reserved.
 
 import luigi
 from ke2mongo.tasks.mongo import MongoTask
+from ke2mongo.lib.multimedia import get_publishable_fields
 
 class MongoMultimediaTask(MongoTask):
     """
@@ -17,30 +18,32 @@ class MongoMultimediaTask(MongoTask):
     """
     module = 'emultimedia'
 
-    def process_record(self, data):
-        # Add embargoed date = 0 so we don't have to query against field exists (doesn't use the index)
-        if not 'NhmSecEmbargoDate' in data:
-            data['NhmSecEmbargoDate'] = 0
-
-        # As above - make field indexable
-        if not 'GenDigitalMediaId' in data:
-            data['GenDigitalMediaId'] = 0
-
-        return super(MongoMultimediaTask, self).process_record(data)
+    # Add embargoed date = 0 so we don't have to query against field exists (doesn't use the index)
+    # And the same for GenDigitalMediaId - make field indexable
+    field_defaults = {
+        'NhmSecEmbargoDate': 0,
+        'GenDigitalMediaId': 0
+    }
 
-    def on_success(self):
-        """
-        On completion, add mime format index
-        http://www.nhm.ac.uk/emu-classes/class.EMuMedia.php only works with jpeg + jp2 so we need to filter images
-        @return: None
-        """
-        self.collection = self.get_collection()
+    # http://www.nhm.ac.uk/emu-classes/class.EMuMedia.php only works with jpeg + jp2 so we need to filter images
+    indexes = [
         # Need to filter on web publishable
-        self.collection.ensure_index('AdmPublishWebNoPasswordFlag')
+        'AdmPublishWebNoPasswordFlag',
         # And embargo date
-        self.collection.ensure_index('NhmSecEmbargoDate')
+        'NhmSecEmbargoDate',
         # Add MAM GUID field
-        self.collection.ensure_index('GenDigitalMediaId')
+        'GenDigitalMediaId'
+    ]
+
+    def prepare_record(self, record):
+        # Records aren't processed if the unprocessed flag is set - but the publishable image fields are still needed
+        if self.unprocessed:
+            record.update(get_publishable_fields(record))
+        return super(MongoMultimediaTask, self).prepare_record(record)
+
+    def process_record(self, data):
+        data.update(get_publishable_fields(data))
+        return super(MongoMultimediaTask, self).process_record(data)
 
 
 if __name__ == "__main__":
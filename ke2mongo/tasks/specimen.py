@@ -494,6 +494,8 @@ class SpecimenDatasetTask(DatasetTask):
             df['relationshipOfResource'][
                 df['relatedResourceID'].notnull()] = 'Parts'
 
+            # Includes any site and collection event fields denormalised into the parent - combine_first only
+            # fills fields the part doesn't have, so parts inherit the parent's site as they do via _siteRef
             parent_df = self.get_dataframe(m, 'ecatalogue', self.get_collection_source_columns(
                 'ecatalogue'), parent_irns, '_id')
 
@@ -520,14 +522,18 @@ class SpecimenDatasetTask(DatasetTask):
         # Get all collection columns
         collection_columns = self.get_collection_source_columns()
 
-        # Load extra sites info (if there's an error radius + unit)
-        site_irns = self._get_unique_irns(df, '_siteRef')
+        if self.denormalised:
+            # Site and collection event fields are already in the catalogue records
+            df = df.reset_index(drop=True)
+        else:
+            # Load extra sites info (if there's an error radius + unit)
+            site_irns = self._get_unique_irns(df, '_siteRef')
 
-        sites_df = self.get_dataframe(m, 'esites', collection_columns[
-            'esites'], site_irns, '_esitesIrn')
+            sites_df = self.get_dataframe(m, 'esites', collection_columns[
+                'esites'], site_irns, '_esitesIrn')
 
-        df = pd.merge(df, sites_df, how='outer', left_on=[
-            '_siteRef'], right_on=['_esitesIrn'])
+            df = pd.merge(df, sites_df, how='outer', left_on=[
+                '_siteRef'], right_on=['_esitesIrn'])
 
         # For CITES species, we need to hide Lat/Lon and Locality data - and
         # label images
@@ -539,15 +545,16 @@ class SpecimenDatasetTask(DatasetTask):
         df['centroid'][df['decimalLatitude'].isnull()] = False
 
         # Load collection event data
-        collection_event_irns = self._get_unique_irns(
-            df, '_collectionEventRef')
-
-        # if collection_event_irns:
-        collection_event_df = self.get_dataframe(m, 'ecollectionevents', collection_columns[
-            'ecollectionevents'], collection_event_irns, '_ecollectioneventsIrn')
-        # print collection_event_df
-        df = pd.merge(df, collection_event_df, how='outer', left_on=[
-            '_collectionEventRef'], right_on=['_ecollectioneventsIrn'])
+        if not self.denormalised:
+            collection_event_irns = self._get_unique_irns(
+                df, '_collectionEventRef')
+
+            # if collection_event_irns:
+            collection_event_df = self.get_dataframe(m, 'ecollectionevents', collection_columns[
+                'ecollectionevents'], collection_event_irns, '_ecollectioneventsIrn')
+            # print collection_event_df
+            df = pd.merge(df, collection_event_df, how='outer', left_on=[
+                '_collectionEventRef'], right_on=['_ecollectioneventsIrn'])
 
         # Add parasite life stage
         # Parasite cards use a different field for life stage
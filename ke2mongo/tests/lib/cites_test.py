@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for matching scientific names against the CITES species - see lib.cites
+
+"""
+
+import unittest
+from nose.tools import assert_equal, assert_true, assert_false, assert_is_none
+from ke2mongo.lib.cites import CitesMatcher, normalize_name, strip_authors, get_genus
+
+SPECIES = [
+    'Panthera leo persica',
+    'Ursus  arctos Linnaeus, 1758',
+    'Aloe spp.',
+]
+
+
+def get_matcher(**kwargs):
+    """
+    Get a matcher with the names built from SPECIES, rather than loaded from mongo
+    @return: CitesMatcher
+    """
+    matcher = CitesMatcher(**kwargs)
+    matcher._names = CitesMatcher.build(SPECIES)
+    return matcher
+
+
+class TestNames(unittest.TestCase):
+
+    def test_normalize_name(self):
+        assert_equal(normalize_name('  Panthera   LEO\tpersica '), 'panthera leo persica')
+
+    def test_strip_authors(self):
+        assert_equal(strip_authors('Panthera leo persica (Meyer, 1826)'), 'panthera leo persica')
+        assert_equal(strip_authors('Ursus arctos Linnaeus, 1758'), 'ursus arctos')
+        assert_equal(strip_authors('Aloe spp.'), 'aloe spp.')
+
+    def test_get_genus(self):
+        assert_equal(get_genus('aloe spp.'), 'aloe')
+        assert_equal(get_genus('aloe'), 'aloe')
+        assert_is_none(get_genus('panthera leo'))
+
+
+class TestCitesMatcher(unittest.TestCase):
+
+    def test_exact(self):
+        matcher = get_matcher()
+        assert_true(matcher.match('Panthera leo persica'))
+        assert_true('Panthera leo persica' in matcher)
+        # Exact matching is the default
+        assert_false(matcher.match('panthera leo persica'))
+        assert_false(matcher.match('Ursus arctos Linnaeus, 1758'))
+        assert_false(matcher.match('Ursus arctos'))
+        assert_false(matcher.match('Aloe vera'))
+        assert_false(matcher.match(None))
+        assert_false(matcher.match(''))
+
+    def test_normalize(self):
+        matcher = get_matcher(normalize=True)
+        assert_true(matcher.match('panthera  LEO persica'))
+        assert_true(matcher.match('Ursus arctos Linnaeus, 1758'))
+        assert_false(matcher.match('Ursus arctos'))
+
+    def test_strip_authors(self):
+        matcher = get_matcher(strip_authors=True)
+        assert_true(matcher.match('Ursus arctos'))
+        assert_true(matcher.match('Panthera leo persica (Meyer, 1826)'))
+        assert_false(matcher.match('Panthera leo'))
+
+    def test_genus(self):
+        matcher = get_matcher(genus=True)
+        assert_true(matcher.match('Aloe vera'))
+        assert_true(matcher.match('aloe ferox Mill.'))
+        assert_false(matcher.match('Panthera tigris'))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the export file readers - see lib.compression
+
+"""
+
+import os
+import zlib
+import gzip
+import struct
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_equal, assert_raises
+from ke2mongo.lib.compression import ZlibReader, BGZFReader, ZstdReader, XzReader, GzipFormat, get_bgzf_block_size, open_export_file, zstandard, lzma
+
+# Lines of varying length, some longer than the reader chunk sizes used below
+DATA = ''.join('irn:1=%s\nSummaryData:1=%s\n###\n' % (i, 'x' * (i * 37 % 3000)) for i in range(2000))
+
+
+def gzip_data(data):
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+def bgzf_block(data):
+    """
+    Compress data as a single BGZF block
+    """
+    c = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = c.compress(data) + c.flush()
+    # Header (with the BC extra subfield), compressed data, CRC and uncompressed size
+    size = 18 + len(deflated) + 8
+    header = '\x1f\x8b\x08\x04' + '\x00' * 4 + '\x00\xff' + struct.pack('<H', 6) + 'BC' + struct.pack('<HH', 2, size - 1)
+    return header + deflated + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def bgzf_data(data, block_size=10000):
+    blocks = [bgzf_block(data[i:i + block_size]) for i in range(0, len(data), block_size)]
+    # BGZF files end with an empty block
+    return ''.join(blocks) + bgzf_block('')
+
+
+class ReaderTestMixin(object):
+
+    def get_reader(self):
+        raise NotImplementedError
+
+    def test_read(self):
+        assert_equal(self.get_reader().read(), DATA)
+
+    def test_readline(self):
+        reader = self.get_reader()
+        assert_equal(list(iter(reader.readline, '')), DATA.splitlines(True))
+
+    def test_iterate(self):
+        assert_equal(list(self.get_reader()), DATA.splitlines(True))
+
+    def test_readline_size(self):
+        reader = self.get_reader()
+        assert_equal(reader.readline(3), 'irn')
+        assert_equal(reader.readline(), ':1=0\n')
+
+    def test_read_size(self):
+        reader = self.get_reader()
+        chunks = list(iter(lambda: reader.read(12345), ''))
+        assert_equal(''.join(chunks), DATA)
+        assert_equal(len(chunks[0]), 12345)
+
+    def test_tell(self):
+        reader = self.get_reader()
+        for line in reader:
+            pass
+        assert_equal(reader.tell(), len(DATA))
+
+    def test_seek(self):
+        reader = self.get_reader()
+        reader.seek(50000)
+        assert_equal(reader.tell(), 50000)
+        assert_equal(reader.read(), DATA[50000:])
+
+    def test_seek_backwards(self):
+        reader = self.get_reader()
+        reader.read(100)
+        assert_raises(IOError, reader.seek, 50)
+
+    def test_close(self):
+        reader = self.get_reader()
+        reader.read()
+        reader.close()
+        # Closing again is a no-op
+        reader.close()
+
+
+class TestZlibReader(ReaderTestMixin, unittest.TestCase):
+
+    def get_reader(self):
+        reader = ZlibReader(StringIO(gzip_data(DATA)))
+        reader.chunk_size = 4096
+        return reader
+
+    def test_multiple_members(self):
+        reader = ZlibReader(StringIO(gzip_data(DATA[:1000]) + gzip_data(DATA[1000:])))
+        assert_equal(reader.read(), DATA)
+
+
+class TestBGZFReader(ReaderTestMixin, unittest.TestCase):
+
+    def get_reader(self):
+        reader = BGZFReader(StringIO(bgzf_data(DATA)), threads=3)
+        reader.chunk_size = 4096
+        return reader
+
+    def test_block_size(self):
+        block = bgzf_block(DATA[:100])
+        assert_equal(get_bgzf_block_size(block[:18]), len(block))
+        # Not BGZF
+        assert_equal(get_bgzf_block_size(gzip_data(DATA[:100])[:18]), None)
+
+    def test_truncated(self):
+        data = bgzf_data(DATA)
+        reader = BGZFReader(StringIO(data[:-100]), threads=2)
+        assert_raises(IOError, reader.read)
+        reader.close()
+
+
+class TestGzipFormat(unittest.TestCase):
+
+    def test_bgzf(self):
+        reader = GzipFormat(threads=2).pipe_reader(StringIO(bgzf_data(DATA)))
+        assert_equal(type(reader), BGZFReader)
+        assert_equal(reader.read(), DATA)
+        reader.close()
+
+    def test_bgzf_single_thread(self):
+        # Without threads, BGZF files are read as multi member gzip files
+        reader = GzipFormat(threads=1).pipe_reader(StringIO(bgzf_data(DATA)))
+        assert_equal(type(reader), ZlibReader)
+        assert_equal(reader.read(), DATA)
+
+    def test_gzip(self):
+        reader = GzipFormat(threads=2).pipe_reader(StringIO(gzip_data(DATA)))
+        assert_equal(type(reader), ZlibReader)
+        assert_equal(reader.read(), DATA)
+
+
+class TestZstdReader(ReaderTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        if not zstandard:
+            raise SkipTest('zstandard is not installed')
+
+    def get_reader(self):
+        return ZstdReader(StringIO(zstandard.ZstdCompressor().compress(DATA)))
+
+
+class TestXzReader(ReaderTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        if not lzma:
+            raise SkipTest('lzma is not installed')
+
+    def get_reader(self):
+        return XzReader(StringIO(lzma.compress(DATA)))
+
+
+class TestOpenExportFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'ecatalogue.export.20140101')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_uncompressed(self):
+        with open(self.path, 'wb') as f:
+            f.write(DATA)
+
+        f = open_export_file(self.path)
+        assert_equal(f.read(), DATA)
+        f.close()
+
+    def test_gzip(self):
+        path = '%s.gz' % self.path
+
+        with open(path, 'wb') as f:
+            f.write(gzip_data(DATA))
+
+        f = open_export_file(path)
+        assert_equal(f.read(), DATA)
+        f.close()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for splitting export files into shards - see MongoTask.import_sharded()
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from nose.tools import assert_equal, assert_raises
+from ke2mongo import config
+from ke2mongo.lib.file import get_export_file_ranges, get_shard_duplicates, atomic_write, get_cache_dir, RECORD_DELIMITER
+
+
+def export_record(irn, size=0):
+    return 'irn:1=%s\nSummaryData:1=%s\n%s\n' % (irn, 'x' * size, RECORD_DELIMITER)
+
+
+class TestExportFileRanges(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'ecatalogue.export.20140101')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        return data
+
+    def test_ranges_end_on_record_boundaries(self):
+        data = self.write(''.join(export_record(irn, irn % 7 * 10) for irn in range(1, 101)))
+        ranges = get_export_file_ranges(self.path, 4)
+
+        assert_equal(len(ranges), 4)
+
+        for start, end in ranges:
+            assert_equal(data[start:end].split('\n')[-2], RECORD_DELIMITER)
+
+    def test_ranges_cover_file(self):
+        data = self.write(''.join(export_record(irn, 25) for irn in range(1, 51)))
+        ranges = get_export_file_ranges(self.path, 3)
+
+        assert_equal(ranges[0][0], 0)
+        assert_equal(ranges[-1][1], len(data))
+
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert_equal(end, start)
+
+    def test_more_ranges_than_records(self):
+        data = self.write(export_record(1, 1000) + export_record(2))
+        ranges = get_export_file_ranges(self.path, 10)
+
+        assert_equal(ranges, [(0, len(export_record(1, 1000))), (len(export_record(1, 1000)), len(data))])
+
+    def test_single_range(self):
+        data = self.write(export_record(1) + export_record(2))
+        assert_equal(get_export_file_ranges(self.path, 1), [(0, len(data))])
+
+    def test_empty_file(self):
+        self.write('')
+        assert_equal(get_export_file_ranges(self.path, 4), [])
+
+
+class TestShardDuplicates(unittest.TestCase):
+
+    def test_no_duplicates(self):
+        shard_irns = [np.array([1, 2, 3]), np.array([4, 5])]
+        assert_equal(get_shard_duplicates(shard_irns), {})
+
+    def test_duplicates_within_a_shard_are_ignored(self):
+        shard_irns = [np.array([1, 2, 1]), np.array([4, 5])]
+        assert_equal(get_shard_duplicates(shard_irns), {})
+
+    def test_last_shard_wins(self):
+        shard_irns = [np.array([1, 2, 3]), np.array([2, 4]), np.array([3, 2])]
+        assert_equal(get_shard_duplicates(shard_irns), {2: set([2, 3])})
+
+    def test_duplicates_in_several_shards(self):
+        shard_irns = [np.array([5, 1]), np.array([1, 6]), np.array([6, 7]), np.array([], dtype=np.int64)]
+        assert_equal(get_shard_duplicates(shard_irns), {1: set([1]), 2: set([6])})
+
+    def test_empty_shards(self):
+        assert_equal(get_shard_duplicates([np.array([], dtype=np.int64)]), {})
+        assert_equal(get_shard_duplicates([]), {})
+
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write(self):
+        with atomic_write(self.path, 'w') as f:
+            f.write('new')
+
+        assert_equal(open(self.path).read(), 'new')
+        assert_equal(os.listdir(self.tmp_dir), ['cache.json'])
+
+    def test_failed_write(self):
+        with open(self.path, 'w') as f:
+            f.write('old')
+
+        def _write():
+            with atomic_write(self.path, 'w') as f:
+                f.write('partial')
+                raise ValueError
+
+        assert_raises(ValueError, _write)
+
+        # The original is untouched, and the temporary file removed
+        assert_equal(open(self.path).read(), 'old')
+        assert_equal(os.listdir(self.tmp_dir), ['cache.json'])
+
+
+class TestCacheDir(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        config.set('keemu', 'cache_dir', self.cache_dir)
+
+    def tearDown(self):
+        config.remove_option('keemu', 'cache_dir')
+        shutil.rmtree(self.tmp_dir)
+
+    def test_created_private(self):
+        assert_equal(get_cache_dir(), self.cache_dir)
+        assert_equal(os.stat(self.cache_dir).st_mode & 0777, 0700)
+
+    def test_existing(self):
+        os.mkdir(self.cache_dir, 0755)
+        assert_equal(get_cache_dir(), self.cache_dir)
+
+    def test_writable_by_others(self):
+        os.mkdir(self.cache_dir)
+        os.chmod(self.cache_dir, 0777)
+        assert_raises(IOError, get_cache_dir)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the export file index - see lib.index
+
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from nose.tools import assert_equal, assert_true, assert_false, assert_raises
+from ke2mongo.lib.index import ExportFileIndex
+from ke2mongo.lib.file import get_export_file_ranges, RECORD_DELIMITER
+
+
+def export_record(irn, value=''):
+    return 'rownum=%s\nirn:1=%s\nSummaryData:1=%s\n%s\n' % (irn, irn, value, RECORD_DELIMITER)
+
+
+class TestExportFileIndex(unittest.TestCase):
+
+    # IRN 3 is duplicated - the last version should win
+    records = [export_record(5, 'a'), export_record(3, 'first'), export_record(10, 'x' * 100), export_record(3, 'last'), export_record(7)]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'ecatalogue.export.20140101')
+        self.data = ''.join(self.records)
+
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def gzip_export_file(self):
+        path = '%s.gz' % self.path
+        f = gzip.open(path, 'wb')
+        f.write(self.data)
+        f.close()
+        return path
+
+    def test_lookup(self):
+        index = ExportFileIndex.get(self.path)
+        offset, length = index.lookup(10)
+        assert_equal(self.data[offset:offset + length], export_record(10, 'x' * 100))
+
+    def test_lookup_duplicate(self):
+        index = ExportFileIndex.get(self.path)
+        offset, length = index.lookup(3)
+        assert_equal(self.data[offset:offset + length], export_record(3, 'last'))
+
+    def test_lookup_missing(self):
+        index = ExportFileIndex.get(self.path)
+        assert_raises(KeyError, index.lookup, 4)
+        assert_raises(KeyError, index.lookup, 1)
+        assert_raises(KeyError, index.lookup, 11)
+
+    def test_read_records(self):
+        index = ExportFileIndex.get(self.path)
+        # In file order, ignoring IRNs not in the file
+        assert_equal(index.read_records([7, 404, 5]), [export_record(5, 'a'), export_record(7)])
+
+    def test_compressed(self):
+        path = self.gzip_export_file()
+        index = ExportFileIndex.get(path)
+        assert_equal(index.read_records([3, 10]), [export_record(10, 'x' * 100), export_record(3, 'last')])
+        assert_equal(list(index.index['offset']), list(ExportFileIndex.get(self.path).index['offset']))
+
+    def test_is_current(self):
+        index = ExportFileIndex(self.path)
+        assert_false(index.is_current())
+        index.build()
+        assert_true(index.is_current())
+
+        # Modifying the export file invalidates the index
+        with open(self.path, 'ab') as f:
+            f.write(export_record(11))
+
+        assert_false(ExportFileIndex(self.path).is_current())
+
+    def test_sidecar_files(self):
+        index = ExportFileIndex.get(self.path)
+        assert_true(all(os.path.exists(path) for path in index.sidecar_paths))
+        # Nothing left over from writing them
+        assert_equal(sorted(os.listdir(self.tmp_dir)), sorted([os.path.basename(self.path)] + [os.path.basename(path) for path in index.sidecar_paths]))
+
+    def test_get_ranges(self):
+        index = ExportFileIndex.get(self.path)
+        starts = set(index.index['offset']) | set([len(self.data)])
+
+        for n in range(1, 7):
+            ranges = index.get_ranges(n, len(self.data))
+            assert_true(len(ranges) <= n)
+            assert_equal(ranges[0][0], 0)
+            assert_equal(ranges[-1][1], len(self.data))
+
+            for start, end in ranges:
+                assert_true(start in starts and end in starts)
+
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                assert_equal(end, start)
+
+    def test_get_ranges_with_one_record_per_range(self):
+        index = ExportFileIndex.get(self.path)
+        assert_equal(index.get_ranges(len(self.records), len(self.data)), get_export_file_ranges(self.path, len(self.records)))
+
+    def test_empty_file(self):
+        open(self.path, 'wb').close()
+        index = ExportFileIndex.get(self.path)
+        assert_raises(KeyError, index.lookup, 1)
+        assert_equal(index.read_records([1]), [])
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the luigi resources used by tasks writing to mongo - see lib.mongo
+
+"""
+
+import unittest
+import luigi.configuration
+from nose.tools import assert_equal
+from ke2mongo.lib.mongo import mongo_get_writer_resource, mongo_get_writer_resources
+
+
+class TestWriterResources(unittest.TestCase):
+
+    def setUp(self):
+        self.luigi_config = luigi.configuration.get_config()
+        self.resource = mongo_get_writer_resource()
+
+    def tearDown(self):
+        if self.luigi_config.has_section('resources'):
+            self.luigi_config.remove_option('resources', self.resource)
+
+    def test_no_limit(self):
+        # luigi would cap an unconfigured resource at 1, so the tasks don't use it
+        assert_equal(mongo_get_writer_resources(), {})
+
+    def test_limit(self):
+        self.luigi_config.set('resources', self.resource, '3')
+        assert_equal(mongo_get_writer_resources(), {self.resource: 1})
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the publishable image fields of multimedia records - see lib.multimedia
+
+"""
+
+import unittest
+from nose.tools import assert_equal, assert_true, assert_false, assert_not_in
+from ke2mongo.lib.multimedia import get_publishable_fields, MEDIA_URL
+
+
+def get_record(**fields):
+    """
+    Get a publishable multimedia record, updated with fields
+    @return: dict
+    """
+    record = {
+        'AdmPublishWebNoPasswordFlag': 'Y',
+        'GenDigitalMediaId': '0123456789abcdef',
+        'MulMimeFormat': 'jpeg',
+        'MulTitle': 'Specimen label',
+        'NhmSecEmbargoDate': 0
+    }
+    record.update(fields)
+    return record
+
+
+class TestPublishableFields(unittest.TestCase):
+
+    def test_publishable(self):
+        fields = get_publishable_fields(get_record())
+        assert_true(fields['isPublishableImage'])
+        assert_equal(fields['publishableFrom'], '')
+        assert_equal(fields['media'], {
+            'identifier': MEDIA_URL.format(mam_id='0123456789abcdef'),
+            'format': 'image/jpeg',
+            'type': 'StillImage',
+            'license': 'http://creativecommons.org/licenses/by/4.0/',
+            'rightsHolder': 'The Trustees of the Natural History Museum, London',
+            'title': 'Specimen label'
+        })
+
+    def test_no_title(self):
+        fields = get_publishable_fields(get_record(MulTitle=''))
+        assert_not_in('title', fields['media'])
+
+    def test_not_published(self):
+        fields = get_publishable_fields(get_record(AdmPublishWebNoPasswordFlag='N'))
+        assert_false(fields['isPublishableImage'])
+        assert_not_in('media', fields)
+
+    def test_media_id(self):
+        # GenDigitalMediaId defaults to 0 on import, and is Pending until the image is in the media store
+        for media_id in [0, 'Pending', None]:
+            fields = get_publishable_fields(get_record(GenDigitalMediaId=media_id))
+            assert_false(fields['isPublishableImage'])
+            assert_not_in('media', fields)
+
+    def test_embargo(self):
+        # Publishable from the latest of the embargo dates
+        fields = get_publishable_fields(get_record(NhmSecEmbargoDate='2027-01-01', NhmSecEmbargoExtensionDate='2028-06-30'))
+        assert_equal(fields['publishableFrom'], '2028-06-30')
+        fields = get_publishable_fields(get_record(NhmSecEmbargoDate='2027-01-01', NhmSecEmbargoExtensionDate='2026-06-30'))
+        assert_equal(fields['publishableFrom'], '2027-01-01')
+        # NhmSecEmbargoDate defaults to 0 on import - which isn't an embargo
+        fields = get_publishable_fields(get_record(NhmSecEmbargoDate=0, NhmSecEmbargoExtensionDate='2028-06-30'))
+        assert_equal(fields['publishableFrom'], '2028-06-30')
+        # Embargoed images are still publishable - from their embargo date
+        assert_true(fields['isPublishableImage'])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the schema cache and compiled field tables - see lib.schema
+
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from nose.tools import assert_equal, assert_true
+from ke2mongo import config
+from ke2mongo.lib.schema import load_schema, get_schema_hash, FieldTable
+
+SCHEMA = """
+%Schema =
+(
+    ecatalogue =>
+    {
+        table => 'ecatalogue',
+        columns =>
+        {
+            irn =>
+            {
+                ColumnName => 'irn',
+                DataType => 'Integer',
+            },
+            DarCatalogNumber =>
+            {
+                ColumnName => 'DarCatalogNumber',
+                DataType => 'Text',
+            },
+        },
+    },
+    emultimedia =>
+    {
+        table => 'emultimedia',
+        columns =>
+        {
+            GenDigitalMediaId =>
+            {
+                ColumnName => 'GenDigitalMediaId',
+                DataType => 'Text',
+            },
+        },
+    },
+);
+"""
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.schema_file = os.path.join(self.tmp_dir, 'schema.pl')
+
+        with open(self.schema_file, 'w') as f:
+            f.write(SCHEMA)
+
+        config.set('keemu', 'cache_dir', self.cache_dir)
+
+    def tearDown(self):
+        config.remove_option('keemu', 'cache_dir')
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_schema(self):
+        schema = load_schema(self.schema_file)
+        assert_equal(schema, {'ecatalogue': {'irn': 'Integer', 'DarCatalogNumber': 'Text'}, 'emultimedia': {'GenDigitalMediaId': 'Text'}})
+
+    def test_cache(self):
+        schema = load_schema(self.schema_file)
+        cache_path = os.path.join(self.cache_dir, 'schema.%s.json' % get_schema_hash(self.schema_file))
+
+        # Cached as JSON in the private cache directory
+        with open(cache_path) as f:
+            assert_equal(json.load(f), schema)
+
+        assert_equal(os.stat(self.cache_dir).st_mode & 0777, 0700)
+
+        # And loaded from the cache
+        with open(cache_path, 'w') as f:
+            json.dump({'ecatalogue': {}}, f)
+
+        assert_equal(load_schema(self.schema_file), {'ecatalogue': {}})
+
+    def test_invalid_cache(self):
+        load_schema(self.schema_file)
+        cache_path = os.path.join(self.cache_dir, 'schema.%s.json' % get_schema_hash(self.schema_file))
+
+        # A partially written cache is parsed again
+        with open(cache_path, 'w') as f:
+            f.write('{"ecatalogue":')
+
+        assert_true('emultimedia' in load_schema(self.schema_file))
+
+    def test_field_table(self):
+        table = FieldTable.compile(self.schema_file, 'ecatalogue', {'DarCatalogNumber': 'string'}, {'DarCatalogNumber': '', 'DarFieldNumber': 0})
+        assert_equal(table.apply({'irn': 1, 'DarCatalogNumber': 12}), {'irn': 1, 'DarCatalogNumber': '12', 'DarFieldNumber': 0})
+        assert_equal(table.apply({'irn': 1}), {'irn': 1, 'DarCatalogNumber': '', 'DarFieldNumber': 0})
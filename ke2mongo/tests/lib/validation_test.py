@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the record validation rules - see lib.validation
+
+"""
+
+import logging
+import unittest
+from uuid import UUID
+from nose.tools import assert_equal, assert_true, assert_false
+from ke2mongo.lib.validation import RecordValidator, Exclude, Required, Length, GUID, is_valid_guid
+
+
+class TestRules(unittest.TestCase):
+
+    def test_exclude(self):
+        rule = Exclude('ColRecordType', ['Tissue', 'Missing'], default='Missing')
+        assert_true(rule.check({'ColRecordType': 'Specimen'}))
+        assert_false(rule.check({'ColRecordType': 'Tissue'}))
+        # Missing values use the default
+        assert_false(rule.check({}))
+        assert_true(Exclude('ColRecordType', ['Tissue']).check({}))
+
+    def test_required(self):
+        rule = Required('ColDepartment')
+        assert_true(rule.check({'ColDepartment': 'Zoology'}))
+        assert_false(rule.check({'ColDepartment': ''}))
+        assert_false(rule.check({}))
+
+    def test_length(self):
+        rule = Length('AdmDateInserted', 10)
+        assert_true(rule.check({'AdmDateInserted': '2014-01-01'}))
+        assert_false(rule.check({'AdmDateInserted': '20-09-27'}))
+        assert_false(rule.check({}))
+
+    def test_guid(self):
+        rule = GUID('AdmGUIDPreferredValue')
+        assert_true(rule.check({'AdmGUIDPreferredValue': '6ee5e5ab-5d3e-4c6e-9e6b-6b0e8c1f0f2a'}))
+        assert_false(rule.check({'AdmGUIDPreferredValue': 'not-a-guid'}))
+        # Records without a GUID are valid
+        assert_true(rule.check({}))
+
+    def test_names(self):
+        assert_equal(Required('ColDepartment').name, 'missing_ColDepartment')
+        assert_equal(Length('AdmDateInserted', 10).name, 'invalid_AdmDateInserted')
+        assert_equal(Required('ColDepartment', name='missing_department').name, 'missing_department')
+
+    def test_level(self):
+        assert_equal(Required('ColDepartment').level, logging.DEBUG)
+        assert_equal(Length('AdmDateInserted', 10, level=logging.ERROR).level, logging.ERROR)
+
+
+class TestIsValidGUID(unittest.TestCase):
+
+    def test_equivalent_to_uuid(self):
+        guids = [
+            '6ee5e5ab-5d3e-4c6e-9e6b-6b0e8c1f0f2a',
+            '6EE5E5AB-5D3E-4C6E-9E6B-6B0E8C1F0F2A',
+            '{6ee5e5ab-5d3e-4c6e-9e6b-6b0e8c1f0f2a}',
+            'urn:uuid:6ee5e5ab-5d3e-4c6e-9e6b-6b0e8c1f0f2a',
+            '6ee5e5ab5d3e4c6e9e6b6b0e8c1f0f2a',
+            '6ee5e5ab-5d3e-4c6e-9e6b-6b0e8c1f0f2',
+            '6ee5e5ab-5d3e-4c6e-9e6b-6b0e8c1f0f2g',
+            'not-a-guid',
+        ]
+
+        for guid in guids:
+            try:
+                UUID(guid)
+            except ValueError:
+                valid = False
+            else:
+                valid = True
+
+            assert_equal(is_valid_guid(guid), valid, guid)
+
+
+class TestRecordValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = RecordValidator([
+            Exclude('ColRecordType', ['Tissue'], name='excluded_type'),
+            Required('ColDepartment', name='missing_department'),
+            Length('AdmDateInserted', 10, name='invalid_date_inserted', level=logging.ERROR),
+        ])
+
+    def test_valid(self):
+        assert_equal(self.validator.validate({'ColRecordType': 'Specimen', 'ColDepartment': 'Zoology', 'AdmDateInserted': '2014-01-01'}), None)
+        assert_equal(self.validator.counts, {})
+
+    def test_rejected(self):
+        rule = self.validator.validate({'ColRecordType': 'Specimen', 'ColDepartment': 'Zoology', 'AdmDateInserted': '20-09-27'})
+        assert_equal(rule.name, 'invalid_date_inserted')
+        assert_equal(rule.field, 'AdmDateInserted')
+        assert_equal(rule.level, logging.ERROR)
+
+    def test_first_failed_rule(self):
+        # Fails every rule - but is only rejected, and counted, by the first
+        rule = self.validator.validate({'ColRecordType': 'Tissue'})
+        assert_equal(rule.name, 'excluded_type')
+        assert_equal(self.validator.counts, {'excluded_type': 1})
+
+    def test_counts(self):
+        records = [
+            {'ColRecordType': 'Tissue'},
+            {'ColRecordType': 'Specimen'},
+            {'ColRecordType': 'Specimen', 'ColDepartment': 'Zoology'},
+            {'ColRecordType': 'Specimen', 'ColDepartment': 'Zoology', 'AdmDateInserted': '2014-01-01'},
+            {'ColDepartment': 'Zoology'},
+        ]
+
+        for record in records:
+            self.validator.validate(record)
+
+        assert_equal(self.validator.counts, {'excluded_type': 1, 'missing_department': 1, 'invalid_date_inserted': 2})
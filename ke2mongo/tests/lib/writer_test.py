@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for lib.writer
+
+"""
+
+import datetime
+import unittest
+from collections import OrderedDict
+from nose.tools import assert_equal, assert_not_equal, assert_true, assert_false, assert_raises
+from bson import BSON
+from pymongo.errors import ConnectionFailure
+from ke2mongo.lib.writer import BatchWriter, estimate_bson_size, get_record_hash, get_record_diff, IRNSet
+
+
+class TestEstimateBSONSize(unittest.TestCase):
+
+    def assert_exact(self, record):
+        assert_equal(estimate_bson_size(record), len(BSON.encode(record)))
+
+    def test_strings(self):
+        self.assert_exact({'_id': 'abc', 'DarScientificName': 'Panthera leo', 'Empty': ''})
+
+    def test_unicode(self):
+        self.assert_exact({'ColSiteDescription': u'Montr\xe9al – Qu\xe9bec'})
+
+    def test_nested(self):
+        self.assert_exact({'esites': {'LatLatitude': '51.5', 'LatLongitude': '-0.17'}, 'Tags': ['a', 'bc', {'d': 'ef'}]})
+
+    def test_tuples_as_arrays(self):
+        assert_equal(estimate_bson_size({'Tags': ('a', 'bc')}), len(BSON.encode({'Tags': ['a', 'bc']})))
+
+    def test_64_bit_values(self):
+        self.assert_exact({'RealEmbargoDate': 1.5, 'irn': 2 ** 40, 'inserted': datetime.datetime(2014, 1, 1)})
+
+    def test_bool(self):
+        self.assert_exact({'cites': True})
+
+    def test_estimate_is_never_under(self):
+        # 32 bit ints and nulls are over estimated, so batches never exceed batch_bytes because of them
+        record = {'_id': 1, 'exportFileDate': 20140101, 'RealEmbargoDate': None}
+        assert_true(estimate_bson_size(record) >= len(BSON.encode(record)))
+
+    def test_empty(self):
+        self.assert_exact({})
+
+
+class TestRecordHash(unittest.TestCase):
+
+    record = {'_id': 1, 'irn': '1', 'DarScientificName': 'Panthera leo', 'exportFileDate': 20140101, 'Tags': ['a', 'b'], 'esites': {'LatLatitude': '51.5'}}
+
+    def test_excluded_fields(self):
+        record = dict(self.record, exportFileDate=20140102, recordHash='abc')
+        assert_equal(get_record_hash(self.record, ['exportFileDate']), get_record_hash(record, ['exportFileDate', 'recordHash']))
+
+    def test_included_fields(self):
+        record = dict(self.record, exportFileDate=20140102)
+        assert_not_equal(get_record_hash(self.record), get_record_hash(record))
+
+    def test_key_order(self):
+        keys = sorted(self.record)
+        record = OrderedDict((k, self.record[k]) for k in keys)
+        reversed_record = OrderedDict((k, self.record[k]) for k in reversed(keys))
+        assert_equal(get_record_hash(record), get_record_hash(reversed_record))
+
+    def test_nested_key_order(self):
+        record = dict(self.record, esites=OrderedDict([('LatLatitude', '51.5'), ('LatLongitude', '-0.17')]))
+        reversed_record = dict(self.record, esites=OrderedDict([('LatLongitude', '-0.17'), ('LatLatitude', '51.5')]))
+        assert_equal(get_record_hash(record), get_record_hash(reversed_record))
+
+    def test_changed_value(self):
+        assert_not_equal(get_record_hash(self.record), get_record_hash(dict(self.record, DarScientificName='Panthera tigris')))
+
+    def test_list_order(self):
+        assert_not_equal(get_record_hash(self.record), get_record_hash(dict(self.record, Tags=['b', 'a'])))
+
+    def test_lists_and_tuples(self):
+        # Tuples are stored as lists - so a record read back from mongo has the same hash
+        assert_equal(get_record_hash(self.record), get_record_hash(dict(self.record, Tags=('a', 'b'))))
+
+    def test_nesting(self):
+        # Values moved between levels shouldn't collide
+        assert_not_equal(get_record_hash({'a': ['b', 'c']}), get_record_hash({'a': ['b'], 'c': []}))
+
+
+class TestRecordDiff(unittest.TestCase):
+
+    # As read back from mongo - lists and unicode strings
+    existing = {'_id': 1, 'irn': u'1', 'DarScientificName': u'Panthera leo', 'Tags': [u'a', u'b'], 'esites': {'LatLatitude': u'51.5'}, 'exportFileDate': 20140101}
+
+    def record(self, **fields):
+        record = {'_id': 1, 'irn': '1', 'DarScientificName': 'Panthera leo', 'Tags': ('a', 'b'), 'esites': {'LatLatitude': '51.5'}, 'exportFileDate': 20140101}
+        record.update(fields)
+        return record
+
+    def test_unchanged(self):
+        assert_equal(get_record_diff(self.existing, self.record()), {})
+
+    def test_set_changed(self):
+        assert_equal(get_record_diff(self.existing, self.record(DarScientificName='Panthera tigris', exportFileDate=20140102)), {'$set': {'DarScientificName': 'Panthera tigris', 'exportFileDate': 20140102}})
+
+    def test_set_new(self):
+        assert_equal(get_record_diff(self.existing, self.record(cites=True)), {'$set': {'cites': True}})
+
+    def test_unset_removed(self):
+        record = self.record()
+        del record['DarScientificName']
+        assert_equal(get_record_diff(self.existing, record), {'$unset': {'DarScientificName': ''}})
+
+    def test_set_and_unset(self):
+        record = self.record(Tags=('a',))
+        del record['esites']
+        assert_equal(get_record_diff(self.existing, record), {'$set': {'Tags': ('a',)}, '$unset': {'esites': ''}})
+
+    def test_id_not_unset(self):
+        record = self.record()
+        del record['_id']
+        assert_equal(get_record_diff(self.existing, record), {})
+
+    def test_tuples_equal_lists(self):
+        existing = dict(self.existing, Nested=[[u'a', u'b'], {'c': [u'd']}])
+        assert_equal(get_record_diff(existing, self.record(Nested=(('a', 'b'), {'c': ('d',)}))), {})
+
+    def test_utf8_equals_unicode(self):
+        existing = dict(self.existing, ColSiteDescription=u'Montr\xe9al')
+        assert_equal(get_record_diff(existing, self.record(ColSiteDescription=u'Montr\xe9al'.encode('utf-8'))), {})
+
+    def test_nested_change(self):
+        assert_equal(get_record_diff(self.existing, self.record(esites={'LatLatitude': '52'})), {'$set': {'esites': {'LatLatitude': '52'}}})
+
+
+class TestIRNSet(unittest.TestCase):
+
+    def test_contains(self):
+        irns = IRNSet(size=16)
+
+        for irn in [0, 1, 7, 8, 9, 127]:
+            irns.add(irn)
+
+        for irn in [0, 1, 7, 8, 9, 127]:
+            assert_true(irn in irns)
+
+        for irn in [2, 6, 10, 126, 128]:
+            assert_false(irn in irns)
+
+    def test_grows(self):
+        irns = IRNSet(size=1)
+        irns.add(3)
+        irns.add(10 ** 7)
+        assert_true(3 in irns)
+        assert_true(10 ** 7 in irns)
+        assert_false(10 ** 7 - 1 in irns)
+        assert_true(len(irns.bits) > 10 ** 7 / 8)
+
+    def test_beyond_size(self):
+        # IRNs past the end of the bitmap aren't in the set
+        assert_false(10 ** 9 in IRNSet(size=16))
+
+    def test_add_twice(self):
+        irns = IRNSet(size=16)
+        irns.add(5)
+        irns.add(5)
+        assert_true(5 in irns)
+        assert_false(4 in irns)
+
+
+class TestBatchWriter(unittest.TestCase):
+
+    def write_batch(self, collection, batch):
+        collection.extend(batch)
+        return {'inserted': len(batch)}
+
+    def test_write(self):
+        collection = []
+        writer = BatchWriter(self.write_batch, lambda: collection, batch_size=2, writers=1)
+
+        with writer:
+            for irn in range(5):
+                writer.add({'_id': irn})
+
+        assert_equal(sorted(r['_id'] for r in collection), range(5))
+        assert_equal(writer.counts['inserted'], 5)
+
+    def test_get_collection_error(self):
+        # If the writers can't get a collection, the error is raised in the producer - rather than it blocking on the full queue
+
+        def get_collection():
+            raise ConnectionFailure('connection refused')
+
+        def write():
+            with BatchWriter(self.write_batch, get_collection, batch_size=1, writers=2, queue_size=1) as writer:
+                for irn in range(100):
+                    writer.add({'_id': irn})
+
+        assert_raises(ConnectionFailure, write)
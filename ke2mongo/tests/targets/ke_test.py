@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for the export file target - see targets.ke
+
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from nose.tools import assert_equal, assert_is_none, assert_is_not_none, assert_not_equal, assert_false, assert_is_instance, assert_not_is_instance
+from ke2mongo.targets.ke import KEFileTarget
+
+EXPORT_DATA = 'irn:1=1\nSummaryData:1=One\n###\nirn:1=2\nSummaryData:1=Two\n###\n'
+
+
+class TestKEFileTarget(unittest.TestCase):
+
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.export_dir)
+
+    def get_target(self, extension=''):
+        path = os.path.join(self.export_dir, 'ecatalogue.export.20140101' + extension)
+        f = gzip.open(path, 'wb') if extension == '.gz' else open(path, 'wb')
+        with f:
+            f.write(EXPORT_DATA)
+        return KEFileTarget(self.export_dir, 'ecatalogue', 20140101, 'export')
+
+    def test_plain_split_in_place(self):
+        target = self.get_target()
+        assert_is_none(target.compression)
+
+        # Plain files are split where they are, without a decompressed copy
+        with target.uncompressed_path() as path:
+            assert_equal(path, target.path)
+
+        assert_equal(os.listdir(self.export_dir), ['ecatalogue.export.20140101'])
+
+    def test_compressed_decompressed(self):
+        target = self.get_target('.gz')
+        assert_is_not_none(target.compression)
+
+        with target.uncompressed_path() as path:
+            assert_not_equal(path, target.path)
+            with open(path, 'rb') as f:
+                assert_equal(f.read(), EXPORT_DATA)
+
+        # The decompressed copy is removed
+        assert_false(os.path.exists(path))
+
+    def test_plain_reader(self):
+        # Plain files are read directly, rather than through luigi's file wrappers
+        reader = self.get_target().open_reader()
+
+        with reader:
+            assert_is_instance(reader._f, file)
+            assert_equal(reader.read(), EXPORT_DATA)
+
+    def test_compressed_reader(self):
+        reader = self.get_target('.gz').open_reader()
+
+        with reader:
+            assert_not_is_instance(reader._f, file)
+            assert_equal(reader.read(), EXPORT_DATA)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Created on 2026-10-16.
+
+Tests for splitting export files into chunk files - see KESplitTask
+
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from nose.tools import assert_equal
+from ke2mongo import config
+from ke2mongo.tasks.ke import KESplitTask
+
+EXPORT_DATA = ''.join('irn:1=%s\nSummaryData:1=Record %s\n###\n' % (irn, irn) for irn in range(1, 101))
+
+
+class TestKESplitTask(unittest.TestCase):
+
+    def setUp(self):
+        self.export_dir = tempfile.mkdtemp()
+        self.export_dir_option = config.get('keemu', 'export_dir')
+        config.set('keemu', 'export_dir', self.export_dir)
+
+    def tearDown(self):
+        config.set('keemu', 'export_dir', self.export_dir_option)
+        shutil.rmtree(self.export_dir)
+
+    def split(self, extension=''):
+        path = os.path.join(self.export_dir, 'ecatalogue.export.20140101' + extension)
+        f = gzip.open(path, 'wb') if extension == '.gz' else open(path, 'wb')
+        with f:
+            f.write(EXPORT_DATA)
+
+        task = KESplitTask(module='ecatalogue', file_extension='export', date=20140101, chunks=3)
+        task.run()
+
+        chunks = []
+
+        for target in task.output():
+            with open(target.path, 'rb') as f:
+                chunks.append(f.read())
+
+        return chunks
+
+    def assert_chunks(self, chunks):
+        assert_equal(len(chunks), 3)
+        assert_equal(''.join(chunks), EXPORT_DATA)
+        # Chunks are split at record boundaries
+        for chunk in chunks:
+            assert_equal(chunk[-4:], '###\n')
+
+    def test_plain(self):
+        self.assert_chunks(self.split())
+        # Split in place - nothing but the export file and its chunks
+        assert_equal(sorted(os.listdir(self.export_dir)), ['chunks', 'ecatalogue.export.20140101'])
+
+    def test_compressed(self):
+        self.assert_chunks(self.split('.gz'))